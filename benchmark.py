@@ -0,0 +1,212 @@
+import io
+import os
+import time
+import json
+import tempfile
+import argparse
+import tracemalloc
+import contextlib
+from jydraft import *
+
+def build_synthetic_draft(segment_count: int, json_backend: str = "json") -> JianyingDraft:
+    """Build a draft with one video material cut into segment_count short segments"""
+    draft = JianyingDraft("Benchmark", probe=False, json_backend=json_backend)
+    track_id = draft.tracks[0]["id"]
+    material_id = draft.add_video_material("/media/benchmark.mp4", duration=10000000)
+    for _ in range(segment_count):
+        draft.add_segment_to_track(track_id, material_id, duration=1000000)
+    return draft
+
+def bench_json_backends(sizes=(1000, 10000, 100000), repeat: int = 1):
+    """Time save_draft with every installed JSON backend, indented and compact"""
+    results = []
+    backends = []
+    for name in JSON_BACKENDS:
+        try:
+            get_json_backend(name)
+            backends.append(name)
+        except ImportError:
+            print(f"{name}: not installed, skipped")
+
+    print(f"{'segments':>10} {'backend':>8} {'mode':>8} {'seconds':>10} {'MB':>8}")
+    for size in sizes:
+        draft = build_synthetic_draft(size)
+        for name in backends:
+            draft.json_backend = get_json_backend(name)
+            for compact in (False, True):
+                with tempfile.TemporaryDirectory() as output_dir:
+                    best = None
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        with contextlib.redirect_stdout(io.StringIO()):  # silence "Draft saved to"
+                            draft.save_draft(output_dir, compact=compact)
+                        elapsed = time.perf_counter() - start
+                        best = elapsed if best is None else min(best, elapsed)
+                    size_mb = sum(os.path.getsize(os.path.join(output_dir, f)) for f in os.listdir(output_dir)) / 1e6
+                mode = "compact" if compact else "indent"
+                print(f"{size:>10} {name:>8} {mode:>8} {best:>10.3f} {size_mb:>8.1f}")
+                results.append({"segments": size, "backend": name, "mode": mode, "seconds": best, "mb": size_mb})
+    return results
+
+def bench_bulk_segments(sizes=(1000, 10000, 100000), repeat: int = 1):
+    """Compare add_segments_bulk with per-call add_image_segment / add_segment_to_track"""
+    def per_call_images(size):
+        draft = JianyingDraft("Benchmark", probe=False)
+        track_id = draft.tracks[0]["id"]
+        for i in range(size):
+            draft.add_image_segment(track_id, f"/media/photo_{i % 100}.jpg", duration=3000000)
+
+    def bulk_images(size):
+        draft = JianyingDraft("Benchmark", probe=False)
+        draft.add_segments_bulk(draft.tracks[0]["id"],
+                                [(f"/media/photo_{i % 100}.jpg", 0, 3000000) for i in range(size)])
+
+    def per_call_segments(size):
+        draft = JianyingDraft("Benchmark", probe=False)
+        track_id = draft.tracks[0]["id"]
+        material_id = draft.add_video_material("/media/benchmark.mp4", duration=10000000)
+        for _ in range(size):
+            draft.add_segment_to_track(track_id, material_id, duration=1000000)
+
+    def bulk_segments(size):
+        draft = JianyingDraft("Benchmark", probe=False)
+        material_id = draft.add_video_material("/media/benchmark.mp4", duration=10000000)
+        draft.add_segments_bulk(draft.tracks[0]["id"], [(material_id, 0, 1000000)] * size)
+
+    cases = [
+        ("add_image_segment", per_call_images),
+        ("bulk (paths)", bulk_images),
+        ("add_segment_to_track", per_call_segments),
+        ("bulk (material id)", bulk_segments),
+    ]
+    results = []
+    print(f"{'segments':>10} {'path':>22} {'seconds':>10}")
+    for size in sizes:
+        for name, case in cases:
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                case(size)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{size:>10} {name:>22} {best:>10.3f}")
+            results.append({"segments": size, "path": name, "seconds": best})
+    return results
+
+def run_phases(segment_count: int, track_count: int = 4, trace: bool = False):
+    """Build and save a synthetic draft phase by phase; returns {phase: seconds or peak MB}
+    
+    Segments are spread over track_count video tracks, with one material per
+    ten segments. With trace=True the tracemalloc peak of each phase is
+    returned instead of its wall time.
+    """
+    measurements = {}
+    
+    @contextlib.contextmanager
+    def phase(name):
+        if trace:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        measurements[name] = (tracemalloc.get_traced_memory()[1] - baseline) / 1e6 if trace else elapsed
+    
+    draft = JianyingDraft("Benchmark", probe=False)
+    track_ids = [draft.tracks[0]["id"]] + [draft.add_track("video") for _ in range(track_count - 1)]
+    
+    with phase("add_video_material"):
+        material_ids = [draft.add_video_material(f"/media/clip_{i}.mp4", duration=10000000)
+                        for i in range(max(1, segment_count // 10))]
+    with phase("add_segment_to_track"):
+        for i in range(segment_count):
+            draft.add_segment_to_track(track_ids[i % track_count], material_ids[i % len(material_ids)],
+                                       duration=1000000)
+    with phase("generate_draft_info"):
+        draft.generate_draft_info()
+    with phase("generate_draft_meta_info"):
+        draft.generate_draft_meta_info()
+    with tempfile.TemporaryDirectory() as output_dir:
+        with phase("save_draft"), contextlib.redirect_stdout(io.StringIO()):
+            draft.save_draft(output_dir)
+    return measurements
+
+def bench_phases(sizes=(100, 1000, 10000, 100000), repeat: int = 1):
+    """Wall time (best of repeat) and tracemalloc peak of each draft building phase"""
+    results = []
+    print(f"{'segments':>10} {'phase':>26} {'seconds':>10} {'peak MB':>10}")
+    for size in sizes:
+        runs = [run_phases(size) for _ in range(repeat)]
+        tracemalloc.start()
+        try:
+            peaks = run_phases(size, trace=True)
+        finally:
+            tracemalloc.stop()
+        for name, peak in peaks.items():
+            seconds = min(run[name] for run in runs)
+            print(f"{size:>10} {name:>26} {seconds:>10.3f} {peak:>10.2f}")
+            results.append({"segments": size, "phase": name, "seconds": seconds, "peak_mb": peak})
+    return results
+
+def check_waveform(paths=("resources/fire.mp3",), repeat: int = 1, tolerance: float = 0.01):
+    """Time extract_waveform and compare it with the envelope of a single-pass ffmpeg decode
+    
+    The reference is read straight from ffmpeg rather than through to_soundarray(),
+    which also misdecodes some files (AAC tracks in MP4) with moviepy 2.1.
+    """
+    import subprocess
+    import numpy as np
+    import imageio_ffmpeg
+    
+    results = []
+    print(f"{'file':>30} {'points':>8} {'seconds':>10} {'max error':>10}")
+    for path in paths:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            envelope = extract_waveform(path, points_per_second=10, sample_rate=8000)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        
+        raw = subprocess.run([imageio_ffmpeg.get_ffmpeg_exe(), "-v", "error", "-i", path, "-vn",
+                              "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "2", "-ar", "8000", "-"],
+                             capture_output=True, check=True).stdout
+        samples = np.abs(np.frombuffer(raw, "<i2").reshape(-1, 2) / 32768.0).max(axis=1)
+        whole = len(samples) // 800 * 800
+        reference = samples[:whole].reshape(-1, 800).max(axis=1)
+        reference = reference / reference.max()
+        count = min(len(reference), len(envelope))
+        error = float(np.abs(envelope[:count] - reference[:count]).max()) if count else 0.0
+        
+        print(f"{os.path.basename(path):>30} {len(envelope):>8} {best:>10.3f} {error:>10.4f}")
+        results.append({"file": path, "points": len(envelope), "seconds": best, "max_error": error})
+        if error > tolerance:
+            raise AssertionError(f"Waveform of {path} differs from the reference by {error:.4f}")
+    return results
+
+BENCHMARKS = {
+    "backends": bench_json_backends,
+    "bulk": bench_bulk_segments,
+    "phases": bench_phases,
+    "waveform": check_waveform,
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="jianying-draft benchmarks")
+    parser.add_argument("benchmark", nargs="?", default="backends", choices=list(BENCHMARKS),
+                        help="Benchmark to run")
+    parser.add_argument("--files", nargs="+", default=None, help="Audio files for the waveform check")
+    parser.add_argument("--sizes", type=int, nargs="+", default=None,
+                        help="Segment counts of the synthetic drafts (default depends on the benchmark)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per measurement (best is reported)")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+    benchmark = BENCHMARKS[args.benchmark]
+    inputs = args.files if args.benchmark == "waveform" else args.sizes
+    results = benchmark(inputs, args.repeat) if inputs else benchmark(repeat=args.repeat)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"benchmark": args.benchmark, "results": results}, f, indent=2)
+
+if __name__ == "__main__" :
+    main()
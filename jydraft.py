@@ -1,33 +1,79 @@
 # jianying_draft.py
 
+import io
+import os
+import re
+import csv
+import sys
 import json
+import stat
+import gc
+import mmap
+import asyncio
 import uuid
+import array
+import bisect
+import operator
+import functools
+import itertools
 import time
-from typing import List, Dict, Any, Optional
+import random
+import hashlib
+import sqlite3
+import shutil
+import tempfile
+import threading
+import argparse
+import warnings
+import contextlib
+from json.encoder import encode_basestring
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple, Union
 from dataclasses import dataclass, asdict
 from pathlib import Path
 
-@dataclass
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+VIDEO_EXTENSIONS = ['.mp4', '.mov', '.avi', '.mkv', '.webm']
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff']
+AUDIO_EXTENSIONS = ['.mp3', '.wav', '.aac', '.m4a']
+
+@dataclass(slots=True)
 class TimeRange:
     duration: int
     start: int = 0
+    
+    @property
+    def end(self) -> int:
+        return self.start + self.duration
+    
+    def to_dict(self) -> Dict[str, int]:
+        return {"start": self.start, "duration": self.duration}
 
-@dataclass
+@dataclass(slots=True)
 class Transform:
     x: float = 0.0
     y: float = 0.0
 
-@dataclass
+@dataclass(slots=True)
 class Scale:
     x: float = 1.0
     y: float = 1.0
 
-@dataclass
+@dataclass(slots=True)
 class Flip:
     horizontal: bool = False
     vertical: bool = False
 
-@dataclass
+@dataclass(slots=True)
 class Clip:
     alpha: float = 1.0
     flip: Flip = None
@@ -42,47 +88,1811 @@ class Clip:
             self.scale = Scale()
         if self.transform is None:
             self.transform = Transform()
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "alpha": self.alpha,
+            "flip": {"horizontal": self.flip.horizontal, "vertical": self.flip.vertical},
+            "rotation": self.rotation,
+            "scale": {"x": self.scale.x, "y": self.scale.y},
+            "transform": {"x": self.transform.x, "y": self.transform.y}
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Clip":
+        return cls(alpha=data.get("alpha", 1.0), flip=Flip(**data.get("flip", {})),
+                   rotation=data.get("rotation", 0.0), scale=Scale(**data.get("scale", {})),
+                   transform=Transform(**data.get("transform", {})))
+
+_DEFAULT_CLIP = Clip()
+_DEFAULT_CLIP_DICT = _DEFAULT_CLIP.to_dict()
+_MISSING = object()
+
+# Keyframe properties accepted by JianyingDraft.add_keyframes and their Jianying property types
+KEYFRAME_PROPERTIES = {
+    "position_x": "KFTypePositionX",
+    "position_y": "KFTypePositionY",
+    "scale_x": "KFTypeScaleX",
+    "scale_y": "KFTypeScaleY",
+    "rotation": "KFTypeRotation",
+    "alpha": "KFTypeAlpha",
+    "volume": "KFTypeVolume",
+}
+
+class KeyframeCurve:
+    """Keyframes of one segment property, kept in flat arrays and expanded by to_dict()
+    
+    times are microsecond offsets from the segment start (array 'q'), values
+    the property values (array 'd'); keyframe ids are derived from the curve id.
+    """
+    __slots__ = ("id", "property_type", "times", "values")
+    
+    def __init__(self, id: str, property_type: str):
+        self.id = id
+        self.property_type = property_type
+        self.times = array.array("q")
+        self.values = array.array("d")
+    
+    def __len__(self) -> int:
+        return len(self.times)
+    
+    def set_points(self, times: Iterable[int], values: Iterable[float]):
+        """Merge keyframes into the curve, keeping it sorted (a new value replaces one at the same time)
+        
+        Points past the current end are appended and single points bisected in
+        place; only other out-of-order input rebuilds the curve.
+        """
+        times = [int(t) for t in times]
+        values = [float(v) for v in values]
+        if all(a < b for a, b in zip(times, times[1:])) and (not self.times or not times or times[0] > self.times[-1]):
+            self.times.extend(times)
+            self.values.extend(values)
+        elif len(times) == 1:
+            i = bisect.bisect_left(self.times, times[0])
+            if i < len(self.times) and self.times[i] == times[0]:
+                self.values[i] = values[0]
+            else:
+                self.times.insert(i, times[0])
+                self.values.insert(i, values[0])
+        else:
+            points = dict(zip(self.times, self.values))
+            points.update(zip(times, values))
+            ordered = sorted(points)
+            self.times = array.array("q", ordered)
+            self.values = array.array("d", (points[t] for t in ordered))
+    
+    def to_dict(self) -> Dict[str, Any]:
+        curve_id = self.id
+        return {
+            "id": curve_id,
+            "keyframe_list": [
+                {
+                    "curveType": "Line",
+                    "graphID": "",
+                    "id": str(uuid.uuid5(uuid.NAMESPACE_OID, f"{curve_id}:{i}")).upper(),
+                    "left_control": {"x": 0.0, "y": 0.0},
+                    "right_control": {"x": 0.0, "y": 0.0},
+                    "string_value": "",
+                    "time_offset": time_offset,
+                    "values": [value]
+                }
+                for i, (time_offset, value) in enumerate(zip(self.times, self.values))
+            ],
+            "material_id": "",
+            "property_type": self.property_type
+        }
+
+def simplify_keyframes(times, values, tolerance: float) -> Tuple[List[int], List[float]]:
+    """Ramer-Douglas-Peucker simplification of a linearly interpolated curve
+    
+    Drops keyframes while the curve stays within tolerance (in value units) of
+    the original at every dropped time. The first and last keyframes are kept.
+    """
+    import numpy as np
+    
+    t = np.asarray(times, dtype=np.float64)
+    v = np.asarray(values, dtype=np.float64)
+    if len(t) < 3:
+        return t.astype(np.int64).tolist(), v.tolist()
+    
+    keep = np.zeros(len(t), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(t) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        inner = slice(first + 1, last)
+        span = t[last] - t[first]
+        ratio = (t[inner] - t[first]) / span if span else 0.0
+        error = np.abs(v[inner] - (v[first] + (v[last] - v[first]) * ratio))
+        worst = int(np.argmax(error))
+        if error[worst] > tolerance:
+            split = first + 1 + worst
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return t[keep].astype(np.int64).tolist(), v[keep].tolist()
+
+@dataclass(slots=True)
+class Segment:
+    """A track segment storing only what differs from Jianying's defaults
+    
+    The full segment object (~35 keys) is produced by to_dict() at serialization
+    time. Video-only defaults (clip, hdr_settings, uniform_scale, ...) follow
+    track_type (text segments have a clip too); a clip of None means the
+    default clip. overrides holds any other non-default keys, e.g. from drafts
+    opened with JianyingDraft.load(). keyframes curves are expanded into
+    common_keyframes.
+    
+    Segments are read and edited through their attributes (segment.volume,
+    segment.target_timerange.start, ...), not dict keys. Move a placed segment
+    with TrackTimeline (shift, remove + insert) so the track index stays in sync.
+    """
+    id: str
+    material_id: str
+    source_timerange: TimeRange
+    target_timerange: TimeRange
+    extra_material_refs: List[str]
+    track_type: str = "video"
+    clip: Optional[Clip] = None
+    speed: float = 1.0
+    volume: float = 1.0
+    render_index: int = 0
+    overrides: Optional[Dict[str, Any]] = None
+    keyframes: Optional[Dict[str, KeyframeCurve]] = None  # property type -> curve
+    
+    @property
+    def end(self) -> int:
+        """End time of the segment on the timeline"""
+        return self.target_timerange.start + self.target_timerange.duration
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Expand to the full Jianying segment schema"""
+        is_video = self.track_type == "video"
+        has_clip = is_video or self.track_type == "text"
+        segment = {
+            "id": self.id,
+            "material_id": self.material_id,
+            "source_timerange": self.source_timerange.to_dict(),
+            "target_timerange": self.target_timerange.to_dict(),
+            "speed": self.speed,
+            "visible": True,
+            "volume": self.volume,
+            "cartoon": False,
+            "common_keyframes": [],
+            "enable_adjust": is_video,
+            "enable_color_curves": True,
+            "enable_color_match_adjust": False,
+            "enable_color_wheels": True,
+            "enable_lut": is_video,
+            "enable_smart_color_adjust": False,
+            "extra_material_refs": self.extra_material_refs,
+            "group_id": "",
+            "intensifies_audio": False,
+            "is_placeholder": False,
+            "is_tone_modify": False,
+            "keyframe_refs": [],
+            "last_nonzero_volume": 1.0,
+            "render_index": self.render_index,
+            "responsive_layout": {
+                "enable": False,
+                "horizontal_pos_layout": 0,
+                "size_layout": 0,
+                "target_follow": "",
+                "vertical_pos_layout": 0
+            },
+            "reverse": False,
+            "template_id": "",
+            "template_scene": "default",
+            "track_attribute": 0,
+            "track_render_index": 0,
+            "uniform_scale": {"on": True, "value": 1.0} if has_clip else None
+        }
+        
+        # Clip properties for video and text segments
+        segment["clip"] = (self.clip or _DEFAULT_CLIP).to_dict() if has_clip else None
+        segment["hdr_settings"] = {"intensity": 1.0, "mode": 1, "nits": 1000} if is_video else None
+        
+        if self.overrides:
+            segment.update(self.overrides)
+        if self.keyframes:
+            segment["common_keyframes"] = segment["common_keyframes"] + [
+                curve.to_dict() for curve in self.keyframes.values() if len(curve)]
+        return segment
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], track_type: str = "video") -> "Segment":
+        """Build a segment from a Jianying segment object, keeping non-default keys as overrides"""
+        source = data.get("source_timerange") or {"start": 0, "duration": 0}
+        target = data["target_timerange"]
+        clip = data.get("clip")
+        segment = cls(
+            id=data["id"],
+            material_id=data["material_id"],
+            source_timerange=TimeRange(source["duration"], source["start"]),
+            target_timerange=TimeRange(target["duration"], target["start"]),
+            extra_material_refs=list(data.get("extra_material_refs", [])),
+            track_type=track_type,
+            speed=data.get("speed", 1.0),
+            volume=data.get("volume", 1.0),
+            render_index=data.get("render_index", 0)
+        )
+        has_clip = track_type in ("video", "text")
+        if has_clip and isinstance(clip, dict) and clip != _DEFAULT_CLIP_DICT:
+            try:
+                segment.clip = Clip.from_dict(clip)
+            except TypeError:
+                pass  # unknown clip keys are kept in overrides below
+            if segment.clip == _DEFAULT_CLIP:
+                segment.clip = None
+        
+        # Field keys are compared with what the fields write back; every other key with the
+        # static defaults of the track type, in one tuple comparison when nothing differs
+        overrides = {}
+        clip_default = (_DEFAULT_CLIP_DICT if segment.clip is None else segment.clip.to_dict()) if has_clip else None
+        for key, default in (("source_timerange", segment.source_timerange.to_dict()),
+                             ("target_timerange", segment.target_timerange.to_dict()), ("clip", clip_default)):
+            value = data.get(key, _MISSING)
+            if value is not _MISSING and value != default:
+                overrides[key] = value
+        defaults = _static_segment_defaults(track_type)
+        try:
+            unchanged = defaults.get_values(data) == defaults.values and data.keys() <= defaults.known_keys
+        except KeyError:
+            unchanged = False
+        if not unchanged:
+            overrides.update((key, value) for key, value in data.items()
+                             if key not in _SEGMENT_FIELD_KEYS and defaults.by_key.get(key, _MISSING) != value)
+        segment.overrides = overrides or None
+        return segment
+
+# Segment keys stored in Segment fields rather than compared with static defaults
+_SEGMENT_FIELD_KEYS = frozenset(("id", "material_id", "source_timerange", "target_timerange",
+                                 "extra_material_refs", "speed", "volume", "render_index", "clip"))
+
+class _StaticSegmentDefaults:
+    """Segment keys that do not depend on Segment fields, with their defaults for one track type"""
+    __slots__ = ("by_key", "values", "get_values", "known_keys")
+    
+    def __init__(self, track_type: str):
+        expanded = Segment("", "", TimeRange(0), TimeRange(0), [], track_type).to_dict()
+        self.by_key = {key: value for key, value in expanded.items() if key not in _SEGMENT_FIELD_KEYS}
+        self.values = tuple(self.by_key.values())
+        self.get_values = operator.itemgetter(*self.by_key)  # raises KeyError when a key is missing
+        self.known_keys = frozenset(expanded)
+
+_static_defaults_by_type = {}
+
+def _static_segment_defaults(track_type: str) -> _StaticSegmentDefaults:
+    defaults = _static_defaults_by_type.get(track_type)
+    if defaults is None:
+        defaults = _static_defaults_by_type[track_type] = _StaticSegmentDefaults(track_type)
+    return defaults
+
+class TrackTimeline:
+    """Index of a track's segments sorted by timeline start
+    
+    Segments on one track never overlap, so ordering by start also orders by
+    end: placement checks, overlap and "active at t" queries are binary
+    searches (O(log n + k) for k results). The segment list is the track's own
+    "segments" list, kept in timeline order.
+    """
+    
+    def __init__(self, segments: List[Segment]):
+        segments.sort(key=lambda s: s.target_timerange.start)
+        self.segments = segments
+        self.starts = [s.target_timerange.start for s in segments]
+    
+    def __len__(self) -> int:
+        return len(self.segments)
+    
+    @property
+    def end(self) -> int:
+        """End time of the last segment"""
+        return self.segments[-1].end if self.segments else 0
+    
+    def overlapping(self, start: int, end: int) -> List[Segment]:
+        """Segments intersecting the half-open interval [start, end)"""
+        i = bisect.bisect_right(self.starts, start) - 1
+        if i < 0 or self.segments[i].end <= start:
+            i += 1
+        j = bisect.bisect_left(self.starts, end)
+        return self.segments[i:j] if j > i else []
+    
+    def segment_at(self, time: int) -> Optional[Segment]:
+        """The segment playing at the given time, if any"""
+        i = bisect.bisect_right(self.starts, time) - 1
+        if i >= 0 and self.segments[i].end > time:
+            return self.segments[i]
+        return None
+    
+    def gaps(self, start: int = 0, end: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Empty (start, end) intervals between start and end (default: the track end)"""
+        if end is None:
+            end = self.end
+        gaps = []
+        cursor = start
+        for segment in self.overlapping(start, end):
+            if segment.target_timerange.start > cursor:
+                gaps.append((cursor, segment.target_timerange.start))
+            cursor = max(cursor, segment.end)
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+    
+    def append(self, segment: Segment):
+        """Add a segment starting at or after the current end"""
+        if segment.target_timerange.start < self.end:
+            raise ValueError(f"Segment {segment.id} starts before the end of the track")
+        self.segments.append(segment)
+        self.starts.append(segment.target_timerange.start)
+    
+    def extend(self, segments: List[Segment]):
+        """Place many segments: one list extend when they are ordered and follow the track end,
+        otherwise a binary-search insert each (raising ValueError on overlap)"""
+        ordered = all(a.end <= b.target_timerange.start for a, b in zip(segments, segments[1:]))
+        if ordered and (not segments or segments[0].target_timerange.start >= self.end):
+            self.segments.extend(segments)
+            self.starts.extend(s.target_timerange.start for s in segments)
+        else:
+            for segment in segments:
+                self.insert(segment)
+    
+    def insert(self, segment: Segment):
+        """Place a segment at its target start, which must fall in a gap"""
+        start = segment.target_timerange.start
+        if self.overlapping(start, segment.end):
+            raise ValueError(f"Segment {segment.id} overlaps existing segments at {start}")
+        i = bisect.bisect_right(self.starts, start)
+        self.segments.insert(i, segment)
+        self.starts.insert(i, start)
+    
+    def ripple_insert(self, segment: Segment):
+        """Insert a segment at its target start, pushing every later segment back by its duration"""
+        start = segment.target_timerange.start
+        i = bisect.bisect_left(self.starts, start)
+        if i > 0 and self.segments[i - 1].end > start:
+            raise ValueError(f"Cannot ripple insert at {start}: it falls inside segment {self.segments[i - 1].id}")
+        self.shift(i, segment.target_timerange.duration)
+        self.segments.insert(i, segment)
+        self.starts.insert(i, start)
+    
+    def remove(self, segment: Segment, ripple: bool = False) -> int:
+        """Remove a segment, optionally pulling later segments forward to close the gap"""
+        i = bisect.bisect_left(self.starts, segment.target_timerange.start)
+        while self.segments[i] is not segment:
+            i += 1
+        del self.segments[i]
+        del self.starts[i]
+        if ripple:
+            self.shift(i, -segment.target_timerange.duration)
+        return i
+    
+    def shift(self, index: int, delta: int):
+        """Move the segments from index onwards by delta on the timeline"""
+        for segment in itertools.islice(self.segments, index, None):
+            segment.target_timerange.start += delta
+        self.starts[index:] = [start + delta for start in self.starts[index:]]
+
+class JsonBackend:
+    """Stdlib json encoder/decoder used for draft files"""
+    name = "json"
+    
+    def dumps(self, obj: Any, indent: bool = True) -> str:
+        if indent:
+            return json.dumps(obj, ensure_ascii=False, indent=2)
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+    
+    def loads(self, data) -> Any:
+        return json.loads(data)
+
+class OrjsonBackend(JsonBackend):
+    """orjson encoder/decoder (same output as stdlib json apart from float exponents)"""
+    name = "orjson"
+    
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("orjson is not installed")
+    
+    def dumps(self, obj: Any, indent: bool = True) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode("utf-8")
+    
+    def loads(self, data) -> Any:
+        return orjson.loads(data)
+
+class MsgspecBackend(JsonBackend):
+    """msgspec encoder/decoder (same output as stdlib json apart from float exponents)"""
+    name = "msgspec"
+    
+    def __init__(self):
+        if msgspec is None:
+            raise ImportError("msgspec is not installed")
+        self._encoder = msgspec.json.Encoder()
+    
+    def dumps(self, obj: Any, indent: bool = True) -> str:
+        data = self._encoder.encode(obj)
+        if indent:
+            data = msgspec.json.format(data, indent=2)
+        return data.decode("utf-8")
+    
+    def loads(self, data) -> Any:
+        return msgspec.json.decode(data)
+    
+    def __getstate__(self):
+        return {}
+    
+    def __setstate__(self, state):
+        self.__init__()
+
+JSON_BACKENDS = {
+    "orjson": OrjsonBackend,
+    "msgspec": MsgspecBackend,
+    "json": JsonBackend,
+}
+
+def get_json_backend(name: str = "auto") -> JsonBackend:
+    """Return a JSON backend by name; "auto" picks the fastest installed one"""
+    if name == "auto":
+        for backend_class in JSON_BACKENDS.values():
+            try:
+                return backend_class()
+            except ImportError:
+                continue
+    if name not in JSON_BACKENDS:
+        raise ValueError(f"Unknown JSON backend: {name}")
+    return JSON_BACKENDS[name]()
+
+class StreamedObject(dict):
+    """JSON object whose values are written one at a time by JsonStreamWriter"""
+
+class StreamedArray:
+    """JSON array whose items are produced lazily from an iterable by JsonStreamWriter"""
+    __slots__ = ("items",)
+    
+    def __init__(self, items: Iterable[Any]):
+        self.items = items
+
+class RawJson(str):
+    """Already encoded JSON text that JsonStreamWriter copies through unchanged (re-encoded
+    only when its layout differs from the one being written)"""
+
+class TemplatedItem:
+    """JSON object equal to template with its "id" replaced
+    
+    JsonStreamWriter encodes the static part of each template once and only
+    splices the id in for every item.
+    """
+    __slots__ = ("template", "id")
+    
+    def __init__(self, template: Dict[str, Any], id: str):
+        self.template = template
+        self.id = id
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {**self.template, "id": self.id}
+
+class CachedItems:
+    """Run of array items whose encoded text is reused from JsonStreamWriter.cache under key"""
+    __slots__ = ("key", "items")
+    
+    def __init__(self, key: Any, items: Iterable[Any]):
+        self.key = key
+        self.items = items
+
+class JsonStreamWriter:
+    """Write JSON incrementally, encoding StreamedObject/StreamedArray containers piece by piece
+    
+    Everything else is encoded as one chunk by the JSON backend, so memory use is
+    bounded by the largest single item (e.g. one segment) rather than by the whole
+    draft. With compact=False and the stdlib backend the output is identical to
+    json.dump(..., indent=2). CachedItems runs are encoded once and then copied
+    from the cache dict on later writes.
+    """
+    
+    def __init__(self, fp, compact: bool = False, backend: Optional[JsonBackend] = None,
+                 cache: Optional[Dict[Any, str]] = None):
+        self.fp = fp
+        self.compact = compact
+        self.backend = backend if backend is not None else JsonBackend()
+        self.cache = cache if cache is not None else {}
+        self._templates = {}  # (template id, level) -> encoded text around the "id" value
+        self.item_separator = "," if compact else ",\n"
+        self.key_separator = ":" if compact else ": "
+    
+    def _newline(self, level: int) -> str:
+        return "" if self.compact else "\n" + "  " * level
+    
+    def dumps(self, obj: Any, level: int = 0) -> str:
+        """Encode a plain value as it would appear nested at the given indentation level"""
+        text = self.backend.dumps(obj, indent=not self.compact)
+        if not self.compact and level and "\n" in text:
+            text = text.replace("\n", "\n" + "  " * level)
+        return text
+    
+    def write(self, obj: Any, level: int = 0):
+        """Write a value at the given indentation level"""
+        write = self.fp.write
+        if isinstance(obj, StreamedObject):
+            first = True
+            for key, value in obj.items():
+                write(("{" if first else ",") + self._newline(level + 1))
+                write(json.dumps(key, ensure_ascii=False) + self.key_separator)
+                self.write(value, level + 1)
+                first = False
+            write("{}" if first else self._newline(level) + "}")
+        elif isinstance(obj, StreamedArray):
+            first = True
+            for item in obj.items:
+                if isinstance(item, CachedItems):
+                    text = self._encode_cached(item, level + 1)
+                    if not text:
+                        continue
+                    write(("[" if first else ",") + self._newline(level + 1))
+                    write(text)
+                else:
+                    write(("[" if first else ",") + self._newline(level + 1))
+                    self.write(item, level + 1)
+                first = False
+            write("[]" if first else self._newline(level) + "]")
+        elif isinstance(obj, RawJson) and not self._matches_layout(obj, level):
+            value = self.backend.loads(str(obj))
+            self.write(StreamedArray(value) if isinstance(value, list) else value, level)
+        else:
+            write(self.encode(obj, level))
+    
+    def _matches_layout(self, raw: str, level: int) -> bool:
+        """Whether raw JSON text is already laid out as this writer would write it at level"""
+        if self.compact:
+            return "\n" not in raw  # JSON strings cannot hold a raw newline
+        if "\n" not in raw:
+            return len(raw) <= 2  # "[]" or "{}"
+        return (raw.startswith(raw[0] + self._newline(level + 1)) and raw.endswith(self._newline(level) + raw[-1])
+                and raw[len(self._newline(level + 1)) + 1] not in " \t")
+    
+    def encode(self, obj: Any, level: int = 0) -> str:
+        """Encode a non-streamed value (plain, raw or templated) at the given level"""
+        if isinstance(obj, TemplatedItem):
+            key = (id(obj.template), level)
+            parts = self._templates.get(key)
+            if parts is None:
+                placeholder = "@@jydraft-id@@"
+                text = self.dumps({**obj.template, "id": placeholder}, level)
+                parts = self._templates[key] = text.split(encode_basestring(placeholder), 1)
+            return parts[0] + encode_basestring(obj.id) + parts[1]
+        if isinstance(obj, RawJson):
+            return obj
+        return self.dumps(obj, level)
+    
+    def _encode_cached(self, cached: CachedItems, level: int) -> str:
+        text = self.cache.get(cached.key)
+        if text is None:
+            separator = "," + self._newline(level)
+            text = separator.join(self.encode(item, level) for item in cached.items)
+            self.cache[cached.key] = text
+        return text
+
+_JSON_DECODER = json.JSONDecoder()
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_JSON_STRING = r'"[^"\\]*+(?:\\.[^"\\]*+)*+"'
+_JSON_NESTED = r'[\[{](?:[^{}\[\]"]++|' + _JSON_STRING + r')*+[\]}]'
+for _ in range(3):
+    _JSON_NESTED = r'[\[{](?:[^{}\[\]"]++|' + _JSON_STRING + '|' + _JSON_NESTED + r')*+[\]}]'
+_JSON_CONTAINER = re.compile(_JSON_NESTED)  # arrays/objects nested up to four levels deep
+_JSON_CONTAINER_TOKEN = re.compile(_JSON_NESTED + '|' + _JSON_STRING + r'|[\[\]{}]')
+
+def _skip_json_value(text: str, start: int) -> int:
+    """Return the end index of the JSON value at start without building Python objects"""
+    if text[start] not in "[{":
+        return _JSON_DECODER.raw_decode(text, start)[1]
+    match = _JSON_CONTAINER.match(text, start)
+    if match is not None:
+        return match.end()
+    # Deeper nesting: count brackets, consuming strings and shallow containers whole
+    depth = 0
+    for match in _JSON_CONTAINER_TOKEN.finditer(text, start):
+        token = match.group()
+        if len(token) > 1:
+            continue
+        if token in "[{":
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    raise ValueError("Unterminated JSON value")
+
+def _iter_json_object(text: str, start: int) -> Iterator[tuple]:
+    """Yield (key, value_start) for each member of the JSON object at start
+    
+    The caller must advance past each value by sending back its end index; the
+    generator returns the end index of the object.
+    """
+    index = _JSON_WHITESPACE.match(text, start + 1).end()
+    if text[index] == "}":
+        return index + 1
+    while True:
+        key, index = _JSON_DECODER.raw_decode(text, index)
+        index = _JSON_WHITESPACE.match(text, index).end() + 1  # skip ':'
+        index = _JSON_WHITESPACE.match(text, index).end()
+        index = yield key, index
+        index = _JSON_WHITESPACE.match(text, index).end()
+        if text[index] == "}":
+            return index + 1
+        index = _JSON_WHITESPACE.match(text, index + 1).end()  # skip ','
+
+class LazySections(dict):
+    """Materials sub-sections of a loaded draft, kept as raw JSON until first access"""
+    
+    def __init__(self, backend: Optional[JsonBackend] = None):
+        super().__init__()
+        self._backend = backend if backend is not None else JsonBackend()
+        self._raw = {}
+    
+    def set_raw(self, name: str, raw: str):
+        self._raw[name] = raw
+        dict.__setitem__(self, name, None)
+    
+    def is_decoded(self, name: str) -> bool:
+        return name not in self._raw
+    
+    def raw(self, name: str) -> str:
+        return self._raw[name]
+    
+    def __getitem__(self, name: str) -> List[Any]:
+        raw = self._raw.pop(name, None)
+        if raw is not None:
+            dict.__setitem__(self, name, self._backend.loads(raw))
+        return dict.__getitem__(self, name)
+    
+    def __setitem__(self, name: str, value: List[Any]):
+        self._raw.pop(name, None)
+        dict.__setitem__(self, name, value)
+    
+    def get(self, name: str, default=None):
+        return self[name] if name in self else default
+    
+    def values(self):
+        return [self[name] for name in self]
+    
+    def items(self):
+        return [(name, self[name]) for name in self]
+
+@contextlib.contextmanager
+def _gc_paused():
+    """Suspend cyclic garbage collection, e.g. while decoding a large acyclic JSON tree
+    
+    Every few hundred new containers would otherwise trigger a collection that
+    walks all the objects decoded so far.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+# Process umask, read once at import (os.umask can only be read by setting it)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+@contextlib.contextmanager
+def atomic_open(path: Path, mode: str = "w", encoding: Optional[str] = "utf-8"):
+    """Open a temporary file next to path and move it over path once writing succeeded
+    
+    The file gets the permissions of the file it replaces, or those open() would
+    give a new file (mkstemp alone would leave it at 0600).
+    """
+    path = Path(path)
+    try:
+        file_mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        file_mode = 0o666 & ~_UMASK
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with open(fd, mode, encoding=encoding if "b" not in mode else None) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temp_path, file_mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(temp_path)
+        raise
+
+def default_cache_dir() -> Path:
+    """Directory used for on-disk caches (override with JYDRAFT_CACHE_DIR)"""
+    return Path(os.environ.get("JYDRAFT_CACHE_DIR", Path.home() / ".cache" / "jydraft"))
+
+def file_fingerprint(file_path: str) -> str:
+    """Cache key of a file's current version: absolute path + size + mtime (raises FileNotFoundError)"""
+    stat = os.stat(file_path)
+    return f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+class _SqliteCache:
+    """Base of the SQLite caches: a WAL-mode connection shared by threads behind a lock,
+    with an in-memory layer in front of lookups"""
+    
+    def __init__(self, path: Optional[str], default_name: str, schema: Iterable[str]):
+        if path is None:
+            path = default_cache_dir() / default_name
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        
+        self._lock = threading.Lock()
+        self._memory = {}  # key -> value, avoids a query for repeated lookups
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in schema:
+            self._conn.execute(statement)
+        self._conn.commit()
+    
+    def _lookup(self, key: str, query: str, decode=None):
+        # Caller holds self._lock
+        value = self._memory.get(key)
+        if value is None:
+            row = self._conn.execute(query, (key,)).fetchone()
+            if row is not None:
+                value = self._memory[key] = row[0] if decode is None else decode(row[0])
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def probe_media(file_path: str) -> Dict[str, Any]:
+    """Open a media file and read its duration (microseconds), size, fps and audio channels"""
+    ext = Path(file_path).suffix.lower()
+    
+    if ext in IMAGE_EXTENSIONS:
+        from PIL import Image
+        with Image.open(file_path) as image:
+            width, height = image.size
+        return {"duration": None, "width": width, "height": height, "fps": None,
+                "has_audio": False, "audio_channels": 0}
+    
+    if ext in AUDIO_EXTENSIONS:
+        from moviepy import AudioFileClip
+        with AudioFileClip(file_path) as clip:
+            return {"duration": int(round(clip.duration * 1000000)), "width": 0, "height": 0,
+                    "fps": clip.fps, "has_audio": True, "audio_channels": clip.nchannels}
+    
+    from moviepy import VideoFileClip
+    with VideoFileClip(file_path) as clip:
+        width, height = clip.size
+        audio_channels = clip.audio.nchannels if clip.audio is not None else 0
+        return {"duration": int(round(clip.duration * 1000000)), "width": width, "height": height,
+                "fps": clip.fps, "has_audio": clip.audio is not None, "audio_channels": audio_channels}
+
+class MediaProbeCache(_SqliteCache):
+    """Persistent SQLite cache of probe_media() results with LRU eviction
+    
+    Entries are keyed by absolute path + size + mtime (key_mode="stat") or by a
+    hash of the file content (key_mode="content"), so unchanged files are never
+    reopened once probed. Content hashes are themselves cached by path + size +
+    mtime. Hits update last_access in batches of access_batch, flushed before
+    eviction and on close().
+    """
+    access_batch = 256
+    
+    def __init__(self, path: Optional[str] = None, max_entries: int = 100000, key_mode: str = "stat"):
+        if key_mode not in ("stat", "content"):
+            raise ValueError(f"Unknown key mode: {key_mode}")
+        super().__init__(path, "probe_cache.sqlite3", [
+            "CREATE TABLE IF NOT EXISTS probes (key TEXT PRIMARY KEY, info TEXT NOT NULL, last_access REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS probes_last_access ON probes (last_access)",
+            "CREATE TABLE IF NOT EXISTS content_keys (stat_key TEXT PRIMARY KEY, content_key TEXT NOT NULL)"
+        ])
+        self.max_entries = max_entries
+        self.key_mode = key_mode
+        self._content_keys = {}  # file_fingerprint() -> content key
+        self._accessed = {}  # key -> last hit time not yet written
+    
+    def fingerprint(self, file_path: str) -> str:
+        """Return the cache key of a file (raises FileNotFoundError for missing files)"""
+        stat_key = file_fingerprint(file_path)
+        if self.key_mode == "stat":
+            return stat_key
+        with self._lock:
+            content_key = self._content_keys.get(stat_key)
+            if content_key is None:
+                row = self._conn.execute("SELECT content_key FROM content_keys WHERE stat_key = ?",
+                                         (stat_key,)).fetchone()
+                if row is not None:
+                    content_key = self._content_keys[stat_key] = row[0]
+        if content_key is None:
+            digest = hashlib.sha1()
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            content_key = f"sha1:{digest.hexdigest()}:{os.stat(file_path).st_size}"
+            with self._lock:
+                self._content_keys[stat_key] = content_key
+                self._conn.execute("INSERT OR REPLACE INTO content_keys (stat_key, content_key) VALUES (?, ?)",
+                                   (stat_key, content_key))
+                self._conn.commit()
+        return content_key
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached probe result by key, counting hits and misses"""
+        with self._lock:
+            info = self._lookup(key, "SELECT info FROM probes WHERE key = ?", json.loads)
+            if info is None:
+                return None
+            self._accessed[key] = time.time()
+            if len(self._accessed) >= self.access_batch:
+                self._flush_accesses()
+                self._conn.commit()
+            return info
+    
+    def _flush_accesses(self):
+        # Caller holds self._lock and commits
+        if self._accessed:
+            self._conn.executemany("UPDATE probes SET last_access = ? WHERE key = ?",
+                                   [(accessed, key) for key, accessed in self._accessed.items()])
+            self._accessed.clear()
+    
+    def put(self, key: str, info: Dict[str, Any]):
+        """Store a probe result and evict the least recently used entries over max_entries"""
+        with self._lock:
+            self._flush_accesses()
+            self._memory[key] = info
+            self._conn.execute(
+                "INSERT OR REPLACE INTO probes (key, info, last_access) VALUES (?, ?, ?)",
+                (key, json.dumps(info), time.time())
+            )
+            self._evict()
+            self._conn.commit()
+    
+    def probe(self, file_path: str) -> Dict[str, Any]:
+        """Return probe_media() for a file, opening it only on a cache miss"""
+        key = self.fingerprint(file_path)
+        info = self.get(key)
+        if info is None:
+            info = probe_media(file_path)
+            self.put(key, info)
+        return info
+    
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM probes").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            evicted = self._conn.execute(
+                "SELECT key FROM probes ORDER BY last_access ASC LIMIT ?", (excess,)
+            ).fetchall()
+            self._conn.executemany("DELETE FROM probes WHERE key = ?", evicted)
+            self._conn.executemany("DELETE FROM content_keys WHERE content_key = ?", evicted)
+            for (key,) in evicted:
+                self._memory.pop(key, None)
+            if self.key_mode == "content":
+                evicted_keys = {key for (key,) in evicted}
+                self._content_keys = {stat_key: key for stat_key, key in self._content_keys.items()
+                                      if key not in evicted_keys}
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the number of cached entries"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM probes").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries
+        }
+    
+    def clear(self):
+        """Remove every cached entry"""
+        with self._lock:
+            self._memory.clear()
+            self._content_keys.clear()
+            self._accessed.clear()
+            self._conn.execute("DELETE FROM probes")
+            self._conn.execute("DELETE FROM content_keys")
+            self._conn.commit()
+    
+    def close(self):
+        with self._lock:
+            self._flush_accesses()
+            self._conn.commit()
+        super().close()
+
+def _iter_audio_chunks(file_path: str, sample_rate: int):
+    """Decode an audio file into (samples, channels) float arrays of one second each
+    
+    moviepy (2.1/2.2) decodes chunks of 200k+ samples incorrectly, so chunks are kept small.
+    """
+    from moviepy import AudioFileClip
+    
+    with AudioFileClip(file_path, fps=sample_rate) as clip:
+        yield from clip.iter_chunks(chunksize=sample_rate, fps=sample_rate)
+
+def extract_waveform(file_path: str, points_per_second: int = 10, sample_rate: int = 8000):
+    """Decode an audio file into a NumPy peak envelope (float32, 0..1, points_per_second values per second)"""
+    import numpy as np
+    
+    window = max(1, sample_rate // points_per_second)
+    peaks = []
+    carry = np.empty(0, dtype=np.float32)
+    for chunk in _iter_audio_chunks(file_path, sample_rate):
+        samples = np.abs(chunk).max(axis=1) if chunk.ndim > 1 else np.abs(chunk)
+        samples = np.concatenate([carry, samples.astype(np.float32)])
+        usable = len(samples) - len(samples) % window
+        if usable:
+            peaks.append(samples[:usable].reshape(-1, window).max(axis=1))
+        carry = samples[usable:]
+    if len(carry):
+        peaks.append(carry.max(keepdims=True))
+    
+    envelope = np.concatenate(peaks) if peaks else np.zeros(0, dtype=np.float32)
+    peak = envelope.max() if len(envelope) else 0.0
+    if peak > 0:
+        envelope /= peak
+    return envelope
+
+def _iter_onset_strength(file_path: str, sample_rate: int, hop_length: int, frame_length: int):
+    """Yield the positive spectral flux of an audio file, one array per decoded chunk
+    
+    Frames are centred on hops; only a frame's worth of samples and the previous spectrum
+    are carried between chunks, so memory does not grow with the length of the file.
+    """
+    import numpy as np
+    window = np.hanning(frame_length).astype(np.float32)
+    pending = np.zeros(frame_length // 2, dtype=np.float32)
+    previous = None
+    
+    def frames_flux(samples):
+        nonlocal previous
+        count = (len(samples) - frame_length) // hop_length + 1
+        if count <= 0:
+            return np.zeros(0), 0
+        frames = np.lib.stride_tricks.sliding_window_view(samples, frame_length)[::hop_length][:count]
+        spectrum = np.log1p(100.0 * np.abs(np.fft.rfft(frames * window, axis=1)))
+        first = spectrum[:1] if previous is None else previous
+        flux = np.maximum(np.diff(np.concatenate([first, spectrum]), axis=0), 0.0).sum(axis=1)
+        previous = spectrum[-1:]
+        return flux, count * hop_length
+    
+    for chunk in _iter_audio_chunks(file_path, sample_rate):
+        chunk = chunk.mean(axis=1) if chunk.ndim > 1 else chunk
+        pending = np.concatenate([pending, chunk.astype(np.float32)])
+        flux, consumed = frames_flux(pending)
+        pending = pending[consumed:]
+        if len(flux):
+            yield flux
+    flux, _ = frames_flux(np.concatenate([pending, np.zeros(frame_length // 2, dtype=np.float32)]))
+    if len(flux):
+        yield flux
+
+def detect_beats(file_path: str, sample_rate: int = 11025, hop_length: int = 256, frame_length: int = 1024,
+                 min_bpm: float = 60.0, max_bpm: float = 200.0):
+    """Detect the beat grid of an audio file, returned as an int64 NumPy array of microseconds
+    
+    Spectral-flux onsets give the tempo (autocorrelation peak, weighted towards 120 BPM)
+    and the grid phase; beats are then tracked one period at a time, each snapped to the
+    strongest onset close to where it was expected.
+    """
+    import numpy as np
+    
+    chunks = list(_iter_onset_strength(file_path, sample_rate, hop_length, frame_length))
+    flux = np.concatenate(chunks) if chunks else np.zeros(0)
+    if len(flux) < 4:
+        return np.zeros(0, dtype=np.int64)
+    frame_rate = sample_rate / hop_length
+    smooth = max(1, int(frame_rate * 0.5))
+    envelope = np.maximum(flux - np.convolve(flux, np.ones(smooth) / smooth, mode="same"), 0.0)
+    if not envelope.any():
+        return np.zeros(0, dtype=np.int64)
+    
+    # Tempo: autocorrelation peak within the BPM range, weighted by a log-normal prior
+    # around 120 BPM so that a beat is not mistaken for its half or double
+    n = len(envelope)
+    autocorr = np.fft.irfft(np.abs(np.fft.rfft(envelope, 2 * n)) ** 2)[:n]
+    min_lag = max(1, int(frame_rate * 60.0 / max_bpm))
+    max_lag = min(n - 2, int(frame_rate * 60.0 / min_bpm) + 1)
+    if max_lag <= min_lag:
+        return np.zeros(0, dtype=np.int64)
+    lags = np.arange(min_lag, max_lag + 1)
+    prior = np.exp(-0.5 * np.log2(frame_rate * 60.0 / lags / 120.0) ** 2)
+    lag = min_lag + int(np.argmax(autocorr[min_lag:max_lag + 1] * prior))
+    left, center, right = autocorr[lag - 1:lag + 2]
+    curvature = left - 2 * center + right
+    period = lag + (0.5 * (left - right) / curvature if curvature < 0 else 0.0)
+    
+    # Phase: the offset collecting the most onset strength over the first beats
+    head = envelope[:int(period * 32) + 1]
+    phases = np.arange(0.0, period, 0.5)
+    grid = np.rint(phases[:, None] + np.arange(int((len(head) - 1) / period) + 1)[None, :] * period).astype(np.int64)
+    scores = np.where(grid < len(head), head[np.minimum(grid, len(head) - 1)], 0.0).sum(axis=1)
+    
+    # Track: expect each beat one period after the last, snapped within an eighth of a period
+    reach = max(1, int(period / 8))
+    beats = []
+    position = float(phases[int(np.argmax(scores))])
+    while position < n:
+        expected = int(round(position))
+        low, high = max(0, expected - reach), min(n, expected + reach + 1)
+        beat = low + int(np.argmax(envelope[low:high])) if envelope[low:high].any() else expected
+        if not beats or beat > beats[-1]:
+            beats.append(beat)
+        position = beat + period
+    return np.rint(np.array(beats, dtype=np.float64) * (1000000.0 / frame_rate)).astype(np.int64)
+
+class AudioAnalysisCache:
+    """On-disk cache of waveform envelopes and beat grids, stored as memory-mapped .npy files
+    
+    Files are keyed by path + size + mtime and the analysis settings, so each
+    audio file is decoded once no matter how many drafts use it. Bump `version`
+    whenever an analysis changes its output, so stale results are not reused.
+    """
+    version = 2
+    
+    def __init__(self, directory: Optional[str] = None, points_per_second: int = 10):
+        if directory is None:
+            directory = default_cache_dir() / "audio"
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.points_per_second = points_per_second
+        self.hits = 0
+        self.misses = 0
+    
+    def cache_path(self, file_path: str, kind: str) -> Path:
+        """Return the .npy path of one analysis of a file (raises FileNotFoundError for missing files)"""
+        key = f"{kind}|v{self.version}|{file_fingerprint(file_path)}"
+        return self.directory / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.npy"
+    
+    def _load(self, file_path: str, kind: str, analyze):
+        import numpy as np
+        
+        path = self.cache_path(file_path, kind)
+        if path.exists():
+            self.hits += 1
+        else:
+            self.misses += 1
+            result = analyze(file_path)
+            with atomic_open(path, "wb") as f:
+                np.save(f, result)
+        return np.load(path, mmap_mode="r")
+    
+    def waveform(self, file_path: str):
+        """extract_waveform() of a file as a read-only memory map, decoded only on a cache miss"""
+        pps = self.points_per_second
+        return self._load(file_path, f"waveform:{pps}", lambda path: extract_waveform(path, pps))
+    
+    def beats(self, file_path: str):
+        """detect_beats() of a file as a read-only memory map, computed only on a cache miss"""
+        return self._load(file_path, "beats", detect_beats)
+    
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+def render_thumbnail(file_path: str, max_size: int = 320) -> bytes:
+    """Grab a frame of a video (or open an image), fit it in max_size x max_size and encode it as JPEG"""
+    from PIL import Image
+    
+    if Path(file_path).suffix.lower() in IMAGE_EXTENSIONS:
+        image = Image.open(file_path)
+    else:
+        from moviepy import VideoFileClip
+        with VideoFileClip(file_path, audio=False) as clip:
+            image = Image.fromarray(clip.get_frame(min(1.0, clip.duration / 2)))
+    with image:
+        image = image.convert("RGB")
+        image.thumbnail((max_size, max_size))
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+class ThumbnailCache:
+    """On-disk cache of render_thumbnail() JPEGs keyed by media fingerprint (path + size + mtime) and size"""
+    
+    def __init__(self, directory: Optional[str] = None):
+        if directory is None:
+            directory = default_cache_dir() / "thumbnails"
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+    
+    def thumbnail(self, file_path: str, max_size: int = 320) -> Path:
+        """Return the path of a cached thumbnail, rendering it only on a cache miss"""
+        key = f"{file_fingerprint(file_path)}|{max_size}"
+        path = self.directory / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.jpg"
+        if path.exists():
+            self.hits += 1
+        else:
+            self.misses += 1
+            data = render_thumbnail(file_path, max_size)
+            with atomic_open(path, "wb") as f:
+                f.write(data)
+        return path
+    
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+def file_md5(file_path: str, chunk_size: int = 8 << 20) -> str:
+    """MD5 hex digest of a file, hashed through mmap (chunked reads where mapping is not possible)"""
+    digest = hashlib.md5()
+    with open(file_path, "rb") as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)  # hashlib releases the GIL, so threads hash in parallel
+        except (ValueError, OSError):  # empty files and special files cannot be mapped
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+class DigestCache(_SqliteCache):
+    """Persistent SQLite cache of file_md5() digests keyed by file_fingerprint()"""
+    
+    def __init__(self, path: Optional[str] = None):
+        super().__init__(path, "md5_cache.sqlite3",
+                         ["CREATE TABLE IF NOT EXISTS digests (key TEXT PRIMARY KEY, md5 TEXT NOT NULL)"])
+    
+    fingerprint = staticmethod(file_fingerprint)
+    
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._lookup(key, "SELECT md5 FROM digests WHERE key = ?")
+    
+    def put(self, key: str, digest: str):
+        with self._lock:
+            self._memory[key] = digest
+            self._conn.execute("INSERT OR REPLACE INTO digests (key, md5) VALUES (?, ?)", (key, digest))
+            self._conn.commit()
+    
+    def md5(self, file_path: str) -> str:
+        """Return file_md5() of a file, reading it only on a cache miss"""
+        key = self.fingerprint(file_path)
+        digest = self.get(key)
+        if digest is None:
+            digest = file_md5(file_path)
+            self.put(key, digest)
+        return digest
+    
+    def md5_many(self, paths: Iterable[str], workers: Optional[int] = None) -> Dict[str, str]:
+        """Digests of many files, hashing cache misses in parallel on a thread pool
+        
+        Missing or unreadable files are left out of the result.
+        """
+        digests = {}
+        pending = {}  # key -> path
+        for file_path in dict.fromkeys(paths):
+            try:
+                key = self.fingerprint(file_path)
+            except OSError:
+                continue
+            digest = self.get(key)
+            if digest is None:
+                pending[key] = file_path
+            else:
+                digests[file_path] = digest
+        
+        if pending:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(file_md5, file_path): key for key, file_path in pending.items()}
+                for future in as_completed(futures):
+                    key = futures[future]
+                    try:
+                        digest = future.result()
+                    except OSError:
+                        continue
+                    self.put(key, digest)
+                    digests[pending[key]] = digest
+        return digests
+    
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+_default_probe_cache = None
+_default_probe_cache_lock = threading.Lock()
+
+def get_default_probe_cache() -> MediaProbeCache:
+    """Return the process-wide probe cache stored in default_cache_dir()"""
+    global _default_probe_cache
+    with _default_probe_cache_lock:
+        if _default_probe_cache is None:
+            _default_probe_cache = MediaProbeCache()
+        return _default_probe_cache
+
+_default_audio_cache = None
+
+def get_default_audio_cache() -> AudioAnalysisCache:
+    """Return the process-wide audio analysis cache stored in default_cache_dir()"""
+    global _default_audio_cache
+    with _default_probe_cache_lock:
+        if _default_audio_cache is None:
+            _default_audio_cache = AudioAnalysisCache()
+        return _default_audio_cache
+
+_default_digest_cache = None
+
+def get_default_digest_cache() -> DigestCache:
+    """Return the process-wide MD5 digest cache stored in default_cache_dir()"""
+    global _default_digest_cache
+    with _default_probe_cache_lock:
+        if _default_digest_cache is None:
+            _default_digest_cache = DigestCache()
+        return _default_digest_cache
+
+_default_thumbnail_cache = None
+
+def get_default_thumbnail_cache() -> ThumbnailCache:
+    """Return the process-wide thumbnail cache stored in default_cache_dir()"""
+    global _default_thumbnail_cache
+    with _default_probe_cache_lock:
+        if _default_thumbnail_cache is None:
+            _default_thumbnail_cache = ThumbnailCache()
+        return _default_thumbnail_cache
+
+def _uuid4_from_bytes(data: bytes) -> str:
+    """Format 16 random bytes as an uppercase version 4 UUID string"""
+    text = data.hex().upper()
+    # Force the version 4 and RFC 4122 variant nibbles
+    return f"{text[:8]}-{text[8:12]}-4{text[13:16]}-{'89AB'[int(text[16], 16) & 3]}{text[17:20]}-{text[20:]}"
+
+def _format_uuid4(value: int) -> str:
+    """Format 128 random bits as an uppercase version 4 UUID string"""
+    value = (value & ~(0xf000 << 64)) | (0x4000 << 64)  # version 4
+    value = (value & ~(0xc000 << 48)) | (0x8000 << 48)  # RFC 4122 variant
+    text = f"{value:032X}"
+    return f"{text[:8]}-{text[8:12]}-{text[12:16]}-{text[16:20]}-{text[20:]}"
+
+class IdProvider:
+    """Source of ids and timestamps for a draft (uuid4 and the system clock)"""
+    
+    def new_id(self) -> str:
+        """Return a new uppercase UUID string"""
+        return str(uuid.uuid4()).upper()
+    
+    def new_ids(self, count: int) -> List[str]:
+        """Return count new ids at once (one os.urandom read for random providers)"""
+        data = os.urandom(16 * count)
+        return [_uuid4_from_bytes(data[i:i + 16]) for i in range(0, 16 * count, 16)]
+    
+    def now(self) -> float:
+        """Return the current time in seconds"""
+        return time.time()
+
+class FastIdProvider(IdProvider):
+    """Random UUIDs cut from batched os.urandom reads, for high-throughput generation"""
+    
+    def __init__(self, batch_size: int = 4096):
+        self.batch_size = batch_size
+        self._buffer = b""
+        self._offset = 0
+    
+    def new_id(self) -> str:
+        if self._offset >= len(self._buffer):
+            self._buffer = os.urandom(16 * self.batch_size)
+            self._offset = 0
+        data = self._buffer[self._offset:self._offset + 16]
+        self._offset += 16
+        return _uuid4_from_bytes(data)
+
+class SeededIdProvider(IdProvider):
+    """Deterministic UUIDs from a seed and a frozen clock
+    
+    Identical inputs produce byte-identical drafts, so saved drafts can be
+    content-hashed and cached.
+    """
+    
+    def __init__(self, seed: Any = 0, timestamp: float = 0.0):
+        self._random = random.Random(seed)
+        self.timestamp = timestamp
+    
+    def new_id(self) -> str:
+        return _format_uuid4(self._random.getrandbits(128))
+    
+    def new_ids(self, count: int) -> List[str]:
+        return [self.new_id() for _ in range(count)]
+    
+    def now(self) -> float:
+        return self.timestamp
+
+_CUE_TIMING = re.compile(r"^\s*(\S+)\s+-->\s+(\S+)")
+_CUE_TIME = re.compile(r"^(?:(\d+):)?(\d{1,2}):(\d{2})[,.](\d{1,3})$")
+_CUE_TAG = re.compile(r"<[^>]*>")
+
+def _parse_cue_time(value: str) -> int:
+    match = _CUE_TIME.match(value)
+    if match is None:
+        raise ValueError(f"Invalid subtitle timestamp: {value}")
+    hours, minutes, seconds, fraction = match.groups()
+    milliseconds = int(fraction.ljust(3, "0"))
+    return ((int(hours or 0) * 60 + int(minutes)) * 60 + int(seconds)) * 1000000 + milliseconds * 1000
+
+def iter_subtitle_cues(source) -> Iterator[Tuple[int, int, str]]:
+    """Stream (start, end, text) cues in microseconds from an SRT or WebVTT file
+    
+    source is a file path or an iterable of lines. Cue numbers, the WEBVTT
+    header, NOTE/STYLE blocks, cue settings and inline tags are ignored.
+    """
+    if isinstance(source, (str, Path)):
+        with open(source, "r", encoding="utf-8-sig") as f:
+            yield from iter_subtitle_cues(f)
+        return
+    
+    start = end = None
+    text = []
+    for line in itertools.chain(source, [""]):
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            if start is not None and text:
+                yield start, end, "\n".join(text)
+            start, text = None, []
+            continue
+        if start is None:
+            timing = _CUE_TIMING.match(line)
+            if timing is not None:
+                start, end = _parse_cue_time(timing.group(1)), _parse_cue_time(timing.group(2))
+            continue  # Cue numbers, headers and comment blocks
+        text.append(_CUE_TAG.sub("", line))
+
+class DraftValidationError(ValueError):
+    """Raised by save_draft(validate=True) for a broken draft; issues lists every problem found"""
+    
+    def __init__(self, issues: List[str]):
+        self.issues = issues
+        more = f" (and {len(issues) - 5} more)" if len(issues) > 5 else ""
+        super().__init__(f"Invalid draft: {'; '.join(issues[:5])}{more}")
+
+class DraftStats:
+    """Per-method timers and counters collected by JianyingDraft(stats=...)
+    
+    Timers record calls and seconds per method (plus "json_dump" for encoding
+    and writing the saved files); counters track materials_added,
+    segments_added and bytes_written. Hooks added with add_hook are called as
+    hook(kind, name, value) with kind "timer" (value in seconds) or "counter".
+    One instance can be shared by many drafts to aggregate a whole service.
+    """
+    
+    def __init__(self):
+        self.timers = {}  # name -> [calls, seconds]
+        self.counters = {}  # name -> total
+        self.hooks = []
+        self._lock = threading.Lock()
+    
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+    
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            timer = self.timers.setdefault(name, [0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+        for hook in self.hooks:
+            hook("timer", name, seconds)
+    
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        for hook in self.hooks:
+            hook("counter", name, value)
+    
+    @contextlib.contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+    
+    def as_dict(self) -> Dict[str, Any]:
+        """{"timers": {name: {"calls", "seconds"}}, "counters": {name: value}}"""
+        with self._lock:
+            return {
+                "timers": {name: {"calls": calls, "seconds": seconds} for name, (calls, seconds) in self.timers.items()},
+                "counters": dict(self.counters)
+            }
+    
+    def to_prometheus(self, prefix: str = "jydraft") -> str:
+        """Render the stats in the Prometheus text exposition format"""
+        stats = self.as_dict()
+        lines = [f"# TYPE {prefix}_calls_total counter"]
+        lines += [f'{prefix}_calls_total{{method="{name}"}} {timer["calls"]}' for name, timer in stats["timers"].items()]
+        lines.append(f"# TYPE {prefix}_seconds_total counter")
+        lines += [f'{prefix}_seconds_total{{method="{name}"}} {timer["seconds"]}' for name, timer in stats["timers"].items()]
+        for name, value in stats["counters"].items():
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+    
+    def reset(self):
+        with self._lock:
+            self.timers.clear()
+            self.counters.clear()
+
+def _instrumented(counter: Optional[str] = None):
+    """Time a JianyingDraft method in self.stats when enabled, counting successful calls under counter"""
+    def decorate(method):
+        name = method.__name__
+        
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            stats = self.stats
+            if stats is None:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            result = method(self, *args, **kwargs)
+            stats.record(name, time.perf_counter() - start)
+            if counter is not None:
+                stats.count(counter)
+            return result
+        return wrapper
+    return decorate
+
+# Default supporting materials generated for every segment (the "id" is filled per segment)
+_SPEED_TEMPLATE = {
+    "curve_speed": None,
+    "id": "",
+    "mode": 0,
+    "speed": 1.0,
+    "type": "speed"
+}
+
+_CANVAS_TEMPLATE = {
+    "album_image": "",
+    "blur": 0.0,
+    "color": "",
+    "id": "",
+    "image": "",
+    "image_id": "",
+    "image_name": "",
+    "source_platform": 0,
+    "team_id": "",
+    "type": "canvas_color"
+}
+
+_SOUND_CHANNEL_MAPPING_TEMPLATE = {
+    "audio_channel_mapping": 0,
+    "id": "",
+    "is_config_open": False,
+    "type": ""
+}
+
+_VOCAL_SEPARATION_TEMPLATE = {
+    "choice": 0,
+    "id": "",
+    "production_path": "",
+    "time_range": None,
+    "type": "vocal_separation"
+}
+
+_MATERIAL_ANIMATION_TEMPLATE = {
+    "animations": [],
+    "id": "",
+    "type": "sticker_animation"
+}
+
+# Static fields of materials.texts entries (id, content, type and style are filled per text)
+_TEXT_TEMPLATE = {
+    "add_type": 0,
+    "alignment": 1,
+    "background_alpha": 1.0,
+    "background_color": "",
+    "background_height": 0.14,
+    "background_horizontal_offset": 0.0,
+    "background_round_radius": 0.0,
+    "background_style": 0,
+    "background_vertical_offset": 0.0,
+    "background_width": 0.14,
+    "bold_width": 0.0,
+    "border_alpha": 1.0,
+    "border_color": "",
+    "border_width": 0.08,
+    "check_flag": 7,
+    "combo_info": {"text_templates": []},
+    "content": "",
+    "fixed_height": -1.0,
+    "fixed_width": -1.0,
+    "font_category_id": "",
+    "font_category_name": "",
+    "font_id": "",
+    "font_name": "",
+    "font_path": "",
+    "font_resource_id": "",
+    "font_size": 5.0,
+    "font_source_platform": 0,
+    "font_team_id": "",
+    "font_title": "none",
+    "font_url": "",
+    "fonts": [],
+    "force_apply_line_max_width": False,
+    "global_alpha": 1.0,
+    "group_id": "",
+    "has_shadow": False,
+    "id": "",
+    "initial_scale": 1.0,
+    "is_rich_text": False,
+    "italic_degree": 0,
+    "ktv_color": "",
+    "language": "",
+    "layer_weight": 1,
+    "letter_spacing": 0.0,
+    "line_feed": 1,
+    "line_max_width": 0.82,
+    "line_spacing": 0.02,
+    "multi_language_current": "none",
+    "name": "",
+    "original_size": [],
+    "preset_category": "",
+    "preset_category_id": "",
+    "preset_has_set_alignment": False,
+    "preset_id": "",
+    "preset_index": 0,
+    "preset_name": "",
+    "recognize_task_id": "",
+    "recognize_type": 0,
+    "relevance_segment": [],
+    "shadow_alpha": 0.9,
+    "shadow_angle": -45.0,
+    "shadow_color": "",
+    "shadow_distance": 5.0,
+    "shadow_point": {"x": 0.6363961030678928, "y": -0.6363961030678928},
+    "shadow_smoothing": 0.45,
+    "shape_clip_x": False,
+    "shape_clip_y": False,
+    "source_from": "",
+    "style_name": "",
+    "sub_type": 0,
+    "subtitle_keywords": None,
+    "subtitle_template_original_fontsize": 0.0,
+    "text_alpha": 1.0,
+    "text_color": "#FFFFFF",
+    "text_curve": None,
+    "text_preset_resource_id": "",
+    "text_size": 30,
+    "text_to_audio_ids": [],
+    "tts_auto_update": False,
+    "type": "text",
+    "typesetting": 0,
+    "underline": False,
+    "underline_offset": 0.22,
+    "underline_width": 0.05,
+    "use_effect_default_color": True,
+    "words": {"end_time": [], "start_time": [], "text": []}
+}
+
+# materials section -> (template, index of its id in Segment.extra_material_refs)
+_SUPPORTING_MATERIALS = {
+    "speeds": (_SPEED_TEMPLATE, 0),
+    "canvases": (_CANVAS_TEMPLATE, 1),
+    "sound_channel_mappings": (_SOUND_CHANNEL_MAPPING_TEMPLATE, 2),
+    "vocal_separations": (_VOCAL_SEPARATION_TEMPLATE, 3),
+    "material_animations": (_MATERIAL_ANIMATION_TEMPLATE, 4),
+}
 
 class JianyingDraft:
-    def __init__(self, name: str = "New Project", width: int = 1920, height: int = 1080, fps: float = 30.0):
+    # draft_info materials sub-sections built by _draft_info_layout itself
+    _GENERATED_SECTIONS = {"videos", "audios", "texts", "audio_fades", "beats", "speeds",
+                           "sound_channel_mappings", "vocal_separations", "canvases", "material_animations"}
+    
+    def __init__(self, name: str = "New Project", width: int = 1920, height: int = 1080, fps: float = 30.0,
+                 probe_cache: Optional[MediaProbeCache] = None, probe: bool = True,
+                 json_backend: str = "auto", share_supporting_materials: bool = False,
+                 id_provider: Optional[IdProvider] = None, seed: Any = None,
+                 waveforms: bool = False, beat_detection: bool = False,
+                 audio_cache: Optional[AudioAnalysisCache] = None,
+                 thumbnails: bool = False, thumbnail_cache: Optional[ThumbnailCache] = None,
+                 stats: Union[bool, DraftStats, None] = None,
+                 hash_media: bool = False, digest_cache: Optional[DigestCache] = None,
+                 reuse_materials: bool = False):
         self.name = name
         self.width = width
         self.height = height
         self.fps = fps
-        self.draft_id = str(uuid.uuid4()).upper()
-        self.project_id = str(uuid.uuid4()).upper()
+        
+        # Instrumentation: stats=True collects timers and counters in a new DraftStats
+        self.stats = DraftStats() if stats is True else (stats or None)
+        
+        # Ids and timestamps; a seed selects the deterministic SeededIdProvider
+        if id_provider is None:
+            id_provider = SeededIdProvider(seed) if seed is not None else IdProvider()
+        self.ids = id_provider
+        self.draft_id = self.ids.new_id()
+        self.project_id = self.ids.new_id()
+        
+        # Media probing (falls back to the hard-coded defaults when disabled or unavailable)
+        self.probe = probe
+        self._probe_cache = probe_cache
+        self.bulk_errors = []  # (path, exception) pairs from the last add_materials_bulk call
+        
+        # Opt-in audio analysis (cached on disk per file): wave_points and materials.beats
+        self.waveforms = waveforms
+        self.beat_detection = beat_detection
+        self._audio_cache = audio_cache
+        
+        # Opt-in: fill the meta "md5" fields and merge materials with identical content
+        self.hash_media = hash_media
+        self._digest_cache = digest_cache
+        self._md5_index = {}  # (material kind, md5) -> material id
+        
+        # Opt-in: add_*_segment and add_segments_bulk reuse the material already added for a path
+        self.reuse_materials = reuse_materials
+        self._path_materials = {}  # absolute path -> id of the first material added for it
+        
+        # Opt-in: save_draft writes draft_cover.jpg and thumbnails/<material id>.jpg
+        self.thumbnails = thumbnails
+        self._thumbnail_cache = thumbnail_cache
+        
+        # Opt-in: segments share one canvas, sound channel mapping, vocal separation and
+        # material animation object instead of each getting default copies (speeds stay per segment)
+        self.share_supporting_materials = share_supporting_materials
+        self._shared_material_refs = None
+        
+        # Encoder for saved files (orjson/msgspec when installed, stdlib json otherwise)
+        self.json_backend = get_json_backend(json_backend)
         
         # Initialize basic structure
         self.materials = {
             "videos": [],  # For videos and photos
             "audios": [],  # For audio/music files
+            "texts": [],  # Text and subtitle materials (draft_info only)
         }
         self.tracks = []
         self.duration = 0
         
+        # Lookup indexes kept in sync by add_*_material / add_track
+        self._material_index = {}  # material id -> {"meta": ..., "draft_info": ...}
+        self._track_index = {}  # track id -> track
+        self._timelines = {}  # track id -> TrackTimeline over the track's segments
+        self._segment_index = {}  # segment id -> (track id, segment)
+        self._audio_fade_ids = {}  # audio track id -> id of its generated audio fade
+        
+        # Sections and objects read by load(); supporting materials for them are not regenerated
+        self.extra_materials = LazySections(self.json_backend)  # draft_info materials other than videos/audios/texts
+        self.extra_meta_materials = {}  # draft_meta_info material type -> values (types other than 0/8)
+        self.library_meta_materials = {}  # type 0/8 -> meta entries with no draft_info material (media library)
+        self.created_time = None  # tm_draft_create of a loaded draft
+        self._loaded_segment_ids = set()
+        self._loaded_track_ids = set()
+        
+        # Changes since the last save, used by incremental saves to reuse encoded fragments
+        self.dirty_tracks = set()
+        self.dirty_materials = set()
+        self._fragment_cache = {}
+        self._fragment_cache_mode = None
+        
         # Create default video track
         self.add_track("video")
     
+    def _get_probe_cache(self) -> MediaProbeCache:
+        if self._probe_cache is None:
+            self._probe_cache = get_default_probe_cache()
+        return self._probe_cache
+    
+    @_instrumented()
+    def probe_media(self, file_path: str) -> Dict[str, Any]:
+        """Probe a media file through the cache, returning {} when probing is not possible"""
+        if not self.probe:
+            return {}
+        try:
+            return self._get_probe_cache().probe(file_path)
+        except FileNotFoundError:
+            return {}
+        except ImportError as e:
+            warnings.warn(f"Media probing disabled, {e}; using default durations and sizes")
+            self.probe = False
+            return {}
+    
+    def _get_audio_cache(self) -> AudioAnalysisCache:
+        if self._audio_cache is None:
+            self._audio_cache = get_default_audio_cache()
+        return self._audio_cache
+    
+    @_instrumented()
+    def waveform_points(self, file_path: str) -> List[float]:
+        """Peak envelope of an audio file for wave_points, or [] when it cannot be decoded"""
+        if not self.waveforms:
+            return []
+        try:
+            envelope = self._get_audio_cache().waveform(file_path)
+        except FileNotFoundError:
+            return []
+        except ImportError as e:
+            warnings.warn(f"Waveform extraction disabled, {e}")
+            self.waveforms = False
+            return []
+        return [round(float(point), 4) for point in envelope]
+    
+    @_instrumented()
+    def beat_times(self, file_path: str) -> Optional[List[int]]:
+        """Beat times of an audio file in microseconds, or None when beat detection is off or fails"""
+        if not self.beat_detection:
+            return None
+        try:
+            return self._get_audio_cache().beats(file_path).tolist()
+        except FileNotFoundError:
+            return None
+        except ImportError as e:
+            warnings.warn(f"Beat detection disabled, {e}")
+            self.beat_detection = False
+            return None
+    
+    def _get_digest_cache(self) -> DigestCache:
+        if self._digest_cache is None:
+            self._digest_cache = get_default_digest_cache()
+        return self._digest_cache
+    
+    @_instrumented()
+    def media_md5(self, file_path: str) -> str:
+        """MD5 of a media file for the meta "md5" field, or "" when hashing is off or the file is missing"""
+        if not self.hash_media:
+            return ""
+        try:
+            return self._get_digest_cache().md5(file_path)
+        except OSError:
+            return ""
+    
+    def _register_md5(self, kind: str, digest: str, material_id: str):
+        if digest:
+            self._md5_index[(kind, digest)] = material_id
+    
+    def _register_path(self, file_path: str, material_id: str):
+        self._path_materials.setdefault(os.path.abspath(file_path), material_id)
+    
+    def _reusable_material(self, file_path: str) -> Optional[str]:
+        """Id of the material already added for a path when reuse_materials is on"""
+        if not self.reuse_materials:
+            return None
+        return self._path_materials.get(os.path.abspath(file_path))
+    
+    def _store_material(self, kind: str, record: Dict[str, Any], file_path: str, digest: str) -> str:
+        """Register a new media material in the lists and indexes and count it; returns its id
+        
+        Calls answered by an existing material (same content) return before this,
+        so they neither mint ids nor count as materials_added.
+        """
+        material_id = record["draft_info"]["id"]
+        self.materials[kind].append(record)
+        self._material_index[material_id] = record
+        self.dirty_materials.add(material_id)
+        self._register_md5(kind, digest, material_id)
+        self._register_path(file_path, material_id)
+        if self.stats is not None:
+            self.stats.count("materials_added")
+        return material_id
+    
+    @_instrumented()
     def add_video_material(self, file_path: str, duration: Optional[int] = None, 
                           width: Optional[int] = None, height: Optional[int] = None) -> str:
         """Add a video material"""
-        material_id = str(uuid.uuid4()).lower().replace("-", "")
-        current_time = int(time.time())
-        
         ext = Path(file_path).suffix.lower()
-        is_video = ext in ['.mp4', '.mov', '.avi', '.mkv', '.webm']
+        is_video = ext in VIDEO_EXTENSIONS
         
         if not is_video:
             raise ValueError(f"File {file_path} is not a video file. Use add_image_material() for images.")
         
-        # Default duration for videos (should be detected from actual file)
+        # Identical content already added: reuse that material
+        digest = self.media_md5(file_path)
+        if ("videos", digest) in self._md5_index:
+            return self._md5_index[("videos", digest)]
+        
+        material_id = self.ids.new_id().lower().replace("-", "")
+        current_time = int(self.ids.now())
+        
+        info = {}
+        if duration is None or width is None or height is None:
+            info = self.probe_media(file_path)
+        
+        # Default duration and size for videos that could not be probed
         if duration is None:
-            duration = 10000000  # 10 seconds default
+            duration = info.get("duration") or 10000000  # 10 seconds default
         
         if width is None:
-            width = 1920
+            width = info.get("width") or 1920
         if height is None:
-            height = 1080
+            height = info.get("height") or 1080
         
         material = {
             "id": material_id,
@@ -97,7 +1907,7 @@ class JianyingDraft:
             "import_time_ms": current_time * 1000000,
             "extra_info": Path(file_path).name,
             "item_source": 1,
-            "md5": "",
+            "md5": digest,
             "roughcut_time_range": {"duration": duration, "start": 0},
             "sub_time_range": {"duration": -1, "start": -1}
         }
@@ -123,7 +1933,7 @@ class JianyingDraft:
             "formula_id": "",
             "freeze": None,
             "gameplay": None,
-            "has_audio": True,  # Videos typically have audio
+            "has_audio": info.get("has_audio", True),  # Videos typically have audio
             "height": height,
             "id": material_id.upper(),
             "intensifies_audio_path": "",
@@ -176,34 +1986,39 @@ class JianyingDraft:
             "width": width
         }
         
-        self.materials["videos"].append({
-            "meta": material,
-            "draft_info": video_material
-        })
-        
-        return material_id.upper()
+        return self._store_material("videos", {"meta": material, "draft_info": video_material}, file_path, digest)
     
+    @_instrumented()
     def add_image_material(self, file_path: str, duration: Optional[int] = None, 
                           width: Optional[int] = None, height: Optional[int] = None) -> str:
         """Add an image/photo material"""
-        material_id = str(uuid.uuid4()).lower().replace("-", "")
-        current_time = int(time.time())
-        
         ext = Path(file_path).suffix.lower()
-        is_image = ext in ['.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff']
+        is_image = ext in IMAGE_EXTENSIONS
         
         if not is_image:
             raise ValueError(f"File {file_path} is not an image file. Use add_video_material() for videos.")
         
+        # Identical content already added: reuse that material
+        digest = self.media_md5(file_path)
+        if ("videos", digest) in self._md5_index:
+            return self._md5_index[("videos", digest)]
+        
+        material_id = self.ids.new_id().lower().replace("-", "")
+        current_time = int(self.ids.now())
+        
         # Default duration for images (5 seconds)
         if duration is None:
             duration = 5000000  # 5 seconds
         
-        # Default dimensions (should be detected from actual image)
+        info = {}
+        if width is None or height is None:
+            info = self.probe_media(file_path)
+        
+        # Default dimensions for images that could not be probed
         if width is None:
-            width = 1920
+            width = info.get("width") or 1920
         if height is None:
-            height = 1080
+            height = info.get("height") or 1080
         
         material = {
             "id": material_id,
@@ -218,7 +2033,7 @@ class JianyingDraft:
             "import_time_ms": current_time * 1000000,
             "extra_info": Path(file_path).name,
             "item_source": 1,
-            "md5": "",
+            "md5": digest,
             "roughcut_time_range": {"duration": -1, "start": -1},
             "sub_time_range": {"duration": -1, "start": -1}
         }
@@ -297,23 +2112,18 @@ class JianyingDraft:
             "width": width
         }
         
-        self.materials["videos"].append({
-            "meta": material,
-            "draft_info": image_material
-        })
-        
-        return material_id.upper()
+        return self._store_material("videos", {"meta": material, "draft_info": image_material}, file_path, digest)
     
     def add_material(self, file_path: str, material_type: str = "auto", duration: Optional[int] = None,
                     width: Optional[int] = None, height: Optional[int] = None) -> str:
         """Add any type of material (auto-detects type or use specified type)"""
         if material_type == "auto":
             ext = Path(file_path).suffix.lower()
-            if ext in ['.mp4', '.mov', '.avi', '.mkv', '.webm']:
+            if ext in VIDEO_EXTENSIONS:
                 return self.add_video_material(file_path, duration, width, height)
-            elif ext in ['.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff']:
+            elif ext in IMAGE_EXTENSIONS:
                 return self.add_image_material(file_path, duration, width, height)
-            elif ext in ['.mp3', '.wav', '.aac', '.m4a']:
+            elif ext in AUDIO_EXTENSIONS:
                 return self.add_audio_material(file_path, duration)
             else:
                 raise ValueError(f"Unsupported file type: {ext}")
@@ -326,17 +2136,133 @@ class JianyingDraft:
         else:
             raise ValueError(f"Unknown material type: {material_type}")
     
+    @_instrumented()
+    def add_materials_bulk(self, paths: Iterable[str], workers: Optional[int] = None,
+                           material_type: str = "auto", use_processes: bool = True) -> List[Optional[str]]:
+        """Add many materials at once, probing uncached files concurrently
+        
+        Returns the material ids in input order. Files that fail to probe or to
+        add get None and are listed with their exception in self.bulk_errors.
+        """
+        paths = list(paths)
+        failures = {}
+        
+        if self.probe:
+            cache = self._get_probe_cache()
+            supported = VIDEO_EXTENSIONS + IMAGE_EXTENSIONS + AUDIO_EXTENSIONS
+            
+            # Collect cache misses, probing each distinct file only once
+            pending = {}  # cache key -> (path, input indexes)
+            for i, file_path in enumerate(paths):
+                if material_type == "auto" and Path(file_path).suffix.lower() not in supported:
+                    continue  # add_material reports the unsupported type
+                try:
+                    key = cache.fingerprint(file_path)
+                except FileNotFoundError:
+                    continue  # add_material falls back to the defaults, as for a single file
+                except OSError as e:
+                    failures[i] = e
+                    continue
+                if key in pending:
+                    pending[key][1].append(i)
+                elif cache.get(key) is None:
+                    pending[key] = (file_path, [i])
+            
+            if pending:
+                executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+                with executor_class(max_workers=workers) as executor:
+                    futures = {executor.submit(probe_media, file_path): key
+                               for key, (file_path, _) in pending.items()}
+                    for future in as_completed(futures):
+                        key = futures[future]
+                        try:
+                            cache.put(key, future.result())
+                        except ImportError:
+                            pass  # add_material disables probing and warns
+                        except Exception as e:
+                            for i in pending[key][1]:
+                                failures[i] = e
+        
+        # Hash all files in parallel up front, so add_material finds the digests cached
+        if self.hash_media:
+            self._get_digest_cache().md5_many(paths, workers)
+        
+        # Add materials in input order; probes are now served from the cache
+        return self._add_materials_in_order(paths, material_type, failures)
+    
+    async def add_materials_async(self, paths: Iterable[str], material_type: str = "auto",
+                                  max_concurrent_probes: int = 4) -> List[Optional[str]]:
+        """add_materials_bulk() for asyncio code
+        
+        Each distinct file is probed once in the default executor, with at most
+        max_concurrent_probes probes running at a time; materials are then added
+        from the probe cache in the executor too, since adding them may decode
+        audio (waveforms, beat_detection) and write to the caches. Do not modify
+        the draft from other tasks until this returns. Failures are reported as
+        in add_materials_bulk.
+        """
+        paths = list(paths)
+        failures = {}
+        loop = asyncio.get_running_loop()
+        
+        if self.probe:
+            semaphore = asyncio.Semaphore(max_concurrent_probes)
+            supported = VIDEO_EXTENSIONS + IMAGE_EXTENSIONS + AUDIO_EXTENSIONS
+            indexes = {}  # path -> input indexes
+            for i, file_path in enumerate(paths):
+                if material_type != "auto" or Path(file_path).suffix.lower() in supported:
+                    indexes.setdefault(file_path, []).append(i)
+            
+            async def probe(file_path):
+                async with semaphore:
+                    try:
+                        await loop.run_in_executor(None, self.probe_media, file_path)
+                    except Exception as e:
+                        for i in indexes[file_path]:
+                            failures[i] = e
+            
+            await asyncio.gather(*(probe(file_path) for file_path in indexes))
+        
+        if self.hash_media:
+            await loop.run_in_executor(None, self._get_digest_cache().md5_many, paths)
+        
+        return await loop.run_in_executor(None, self._add_materials_in_order, paths, material_type, failures)
+    
+    def _add_materials_in_order(self, paths: List[str], material_type: str,
+                                failures: Dict[int, Exception]) -> List[Optional[str]]:
+        material_ids = []
+        self.bulk_errors = []
+        for i, file_path in enumerate(paths):
+            error = failures.get(i)
+            if error is None:
+                try:
+                    material_ids.append(self.add_material(file_path, material_type))
+                    continue
+                except Exception as e:
+                    error = e
+            material_ids.append(None)
+            self.bulk_errors.append((file_path, error))
+        
+        return material_ids
+    
+    @_instrumented()
     def add_audio_material(self, file_path: str, duration: Optional[int] = None, 
                           music_id: str = None, name: str = None) -> str:
         """Add an audio/music material with proper JianyingPro structure"""
-        material_id = str(uuid.uuid4()).upper()
-        current_time = int(time.time())
+        # Identical content already added: reuse that material
+        digest = self.media_md5(file_path)
+        if ("audios", digest) in self._md5_index:
+            return self._md5_index[("audios", digest)]
+        
+        material_id = self.ids.new_id()
+        current_time = int(self.ids.now())
         
         if duration is None:
-            duration = 28000000  # Default 28 seconds, should be detected from actual file
+            duration = self.probe_media(file_path).get("duration") or 28000000  # Default 28 seconds
         
         if music_id is None:
-            music_id = str(int(time.time() * 1000000))  # Generate a unique music ID
+            # Generate a unique music ID
+            music_id = str(int(self.ids.now() * 1000000) + len(self.materials["audios"]))
         
         if name is None:
             name = Path(file_path).stem
@@ -361,7 +2287,7 @@ class JianyingDraft:
                 "url": file_path
             }, separators=(',', ': ')),
             "item_source": 1,
-            "md5": "",
+            "md5": digest,
             "roughcut_time_range": {"duration": -1, "start": -1},
             "sub_time_range": {"duration": -1, "start": -1}
         }
@@ -397,19 +2323,22 @@ class JianyingDraft:
             "tone_type": "",
             "type": "music",
             "video_id": "",
-            "wave_points": []
+            "wave_points": self.waveform_points(file_path)
         }
         
-        self.materials["audios"].append({
+        record = {
             "meta": meta_material,
             "draft_info": draft_info_material
-        })
-        
-        return material_id
+        }
+        beats = self.beat_times(file_path)
+        if beats is not None:
+            record["beats"] = beats  # Material-time beat grid, written to materials.beats per segment
+        return self._store_material("audios", record, file_path, digest)
     
+    @_instrumented()
     def add_track(self, track_type: str = "video") -> str:
         """Add a new track and return its ID"""
-        track_id = str(uuid.uuid4()).upper()
+        track_id = self.ids.new_id()
         
         track = {
             "id": track_id,
@@ -422,35 +2351,37 @@ class JianyingDraft:
         }
         
         self.tracks.append(track)
+        self._track_index[track_id] = track
+        self._timelines[track_id] = TrackTimeline(track["segments"])
+        self.dirty_tracks.add(track_id)
+        if track_type == "audio":
+            self._audio_fade_ids[track_id] = self.ids.new_id()
         return track_id
     
+    def _get_shared_material_refs(self) -> List[str]:
+        """Canvas, sound channel mapping, vocal separation and material animation ids shared by segments"""
+        if self._shared_material_refs is None:
+            self._shared_material_refs = [self.ids.new_id() for _ in range(4)]
+        return self._shared_material_refs
+    
+    @_instrumented("segments_added")
     def add_segment_to_track(self, track_id: str, material_id: str, start_time: int = 0, 
                            duration: Optional[int] = None, scale: float = 1.0,
-                           transform_x: float = 0.0, transform_y: float = 0.0) -> str:
-        """Add a segment to a specific track"""
-        segment_id = str(uuid.uuid4()).upper()
-        
-        # Find the material
-        material = None
-        material_type = None
-        
-        # Check video materials (includes both videos and images)
-        for mat in self.materials["videos"]:
-            if mat["draft_info"]["id"] == material_id:
-                material = mat["draft_info"]
-                material_type = "video"
-                break
+                           transform_x: float = 0.0, transform_y: float = 0.0,
+                           at: Optional[int] = None, ripple: bool = False) -> str:
+        """Add a segment to a specific track
         
-        # Check audio materials
-        if not material:
-            for mat in self.materials["audios"]:
-                if mat["draft_info"]["id"] == material_id:
-                    material = mat["draft_info"]
-                    material_type = "audio"
-                    break
+        The segment is appended after the last one unless at gives its timeline
+        position; it must then fall in a gap, or with ripple=True later segments
+        are pushed back to make room.
+        """
+        segment_id = self.ids.new_id()
         
-        if not material:
+        # Find the material
+        record = self._material_index.get(material_id)
+        if record is None:
             raise ValueError(f"Material with ID {material_id} not found")
+        material = record["draft_info"]
         
         # For images, use the provided duration, for videos use actual or provided duration
         if material["type"] == "photo":
@@ -459,142 +2390,520 @@ class JianyingDraft:
             source_duration = duration
         else:
             if duration is None:
-                duration = material["duration"]
+                duration = material.get("duration")
+                if duration is None:
+                    raise ValueError(f"Material with ID {material_id} has no duration; pass one")
             source_duration = duration
         
         # Find the track
-        track = None
-        for t in self.tracks:
-            if t["id"] == track_id:
-                track = t
-                break
-        
-        if not track:
+        track = self._track_index.get(track_id)
+        if track is None:
             raise ValueError(f"Track with ID {track_id} not found")
         
-        # Calculate position on timeline
-        if track["segments"]:
-            last_segment = max(track["segments"], 
-                             key=lambda s: s["target_timerange"]["start"] + s["target_timerange"]["duration"])
-            timeline_start = (last_segment["target_timerange"]["start"] + 
-                            last_segment["target_timerange"]["duration"])
-        else:
-            timeline_start = 0
+        # Calculate position on timeline (append after the current end of the track by default)
+        timeline = self._timelines[track_id]
+        timeline_start = timeline.end if at is None else at
         
-        # Generate supporting materials
-        speed_id = str(uuid.uuid4()).upper()
-        canvas_id = str(uuid.uuid4()).upper()
-        sound_mapping_id = str(uuid.uuid4()).upper()
-        vocal_sep_id = str(uuid.uuid4()).upper()
-        material_animation_id = str(uuid.uuid4()).upper()
+        # Generate supporting materials (text segments have none)
+        if track["type"] == "text":
+            extra_material_refs = []
+        else:
+            speed_id = self.ids.new_id()
+            if self.share_supporting_materials:
+                canvas_id, sound_mapping_id, vocal_sep_id, material_animation_id = self._get_shared_material_refs()
+            else:
+                canvas_id = self.ids.new_id()
+                sound_mapping_id = self.ids.new_id()
+                vocal_sep_id = self.ids.new_id()
+                material_animation_id = self.ids.new_id()
+            
+            extra_material_refs = [speed_id, canvas_id, sound_mapping_id, vocal_sep_id]
+            if material["type"] == "photo":
+                extra_material_refs.append(material_animation_id)
+            elif "beats" in record and track["type"] == "audio":
+                extra_material_refs.append(self.ids.new_id())  # Beats material
         
-        extra_material_refs = [speed_id, canvas_id, sound_mapping_id, vocal_sep_id]
-        if material["type"] == "photo":
-            extra_material_refs.append(material_animation_id)
+        # Only non-default clip properties are stored on the segment
+        clip = None
+        if track["type"] == "video" and (scale != 1.0 or transform_x != 0.0 or transform_y != 0.0):
+            clip = Clip(scale=Scale(scale, scale), transform=Transform(transform_x, transform_y))
         
-        # Base segment structure
-        segment = {
-            "id": segment_id,
-            "material_id": material_id,
-            "source_timerange": {"start": start_time, "duration": source_duration},
-            "target_timerange": {"start": timeline_start, "duration": duration},
-            "speed": 1.0,
-            "visible": True,
-            "volume": 1.0,
-            "cartoon": False,
-            "common_keyframes": [],
-            "enable_adjust": track["type"] == "video",
-            "enable_color_curves": True,
-            "enable_color_match_adjust": False,
-            "enable_color_wheels": True,
-            "enable_lut": track["type"] == "video",
-            "enable_smart_color_adjust": False,
-            "extra_material_refs": extra_material_refs,
-            "group_id": "",
-            "intensifies_audio": False,
-            "is_placeholder": False,
-            "is_tone_modify": False,
-            "keyframe_refs": [],
-            "last_nonzero_volume": 1.0,
-            "render_index": 0,
-            "responsive_layout": {
-                "enable": False,
-                "horizontal_pos_layout": 0,
-                "size_layout": 0,
-                "target_follow": "",
-                "vertical_pos_layout": 0
-            },
-            "reverse": False,
-            "template_id": "",
-            "template_scene": "default",
-            "track_attribute": 0,
-            "track_render_index": 0,
-            "uniform_scale": {"on": True, "value": 1.0} if track["type"] == "video" else None
-        }
+        segment = Segment(
+            id=segment_id,
+            material_id=material_id,
+            source_timerange=TimeRange(source_duration, start_time),
+            target_timerange=TimeRange(duration, timeline_start),
+            extra_material_refs=extra_material_refs,
+            track_type=track["type"],
+            clip=clip
+        )
         
-        # Add clip properties for video segments
-        if track["type"] == "video":
-            segment["clip"] = {
-                "alpha": 1.0,
-                "flip": {"horizontal": False, "vertical": False},
-                "rotation": 0.0,
-                "scale": {"x": scale, "y": scale},
-                "transform": {"x": transform_x, "y": transform_y}
-            }
-            segment["hdr_settings"] = {"intensity": 1.0, "mode": 1, "nits": 1000}
+        if at is None:
+            timeline.append(segment)
+        elif ripple:
+            timeline.ripple_insert(segment)
         else:
-            segment["clip"] = None
-            segment["hdr_settings"] = None
-        
-        track["segments"].append(segment)
+            timeline.insert(segment)
+        self._segment_index[segment_id] = (track_id, segment)
         
         # Update total duration
-        new_end = timeline_start + duration
-        if new_end > self.duration:
-            self.duration = new_end
+        self.dirty_tracks.add(track_id)
+        if timeline.end > self.duration:
+            self.duration = timeline.end
         
         return segment_id
     
+    @_instrumented()
+    def add_segments_bulk(self, track_id: str, items, workers: Optional[int] = None,
+                          at: Optional[int] = None) -> List[str]:
+        """Append many segments to a track in one pass
+        
+        items holds (material, source_start, duration) rows, as a sequence or a
+        NumPy array (a string array is fine: times are converted with int()).
+        material is a material id or a media path (each distinct path is added
+        once, probed in parallel); a duration of None uses the material's
+        default. Target start times come from one cumulative sum, starting at
+        the track end or at at (which must not be before it). On error nothing
+        is added: materials added for new paths are removed again.
+        """
+        timeline = self._get_timeline(track_id)
+        track = self._track_index[track_id]
+        if at is not None and at < timeline.end:
+            raise ValueError(f"Bulk segments must start at or after the track end ({timeline.end})")
+        
+        np = sys.modules.get("numpy")  # only used when the caller already works with NumPy
+        if np is not None and isinstance(items, np.ndarray):
+            materials, source_starts, durations = (items[:, i].tolist() for i in range(3))
+        else:
+            rows = list(items)
+            materials = [row[0] for row in rows]
+            source_starts = [row[1] for row in rows]
+            durations = [row[2] for row in rows]
+        count = len(materials)
+        # Rows of a plain NumPy array share one dtype (strings when paths are mixed in), so
+        # times are converted and checked here, before anything is added to the draft
+        try:
+            source_starts = [int(start) for start in source_starts]
+            durations = [None if duration is None else int(duration) for duration in durations]
+        except (TypeError, ValueError) as error:
+            raise ValueError(f"Bulk segment times must be integers: {error}") from None
+        if any(start < 0 for start in source_starts) or any(d is not None and d <= 0 for d in durations):
+            raise ValueError("Bulk segments need source starts >= 0 and durations > 0")
+        
+        # Resolve media paths to materials, adding each new path once
+        if self.reuse_materials:
+            index, registry = self._material_index, self._path_materials
+            materials = [m if m in index else registry.get(os.path.abspath(m), m) for m in materials]
+        material_counts = {kind: len(records) for kind, records in self.materials.items()}
+        try:
+            new_paths = list(dict.fromkeys(m for m in materials if m not in self._material_index))
+            if new_paths:
+                path_ids = dict(zip(new_paths, self.add_materials_bulk(new_paths, workers=workers)))
+                failed = [path for path, material_id in path_ids.items() if material_id is None]
+                if failed:
+                    raise ValueError(f"Could not add materials: {', '.join(failed)}")
+                materials = [path_ids.get(m, m) for m in materials]
+            records = [self._material_index[m]["draft_info"] for m in materials]
+            
+            # Default durations, then all timeline positions in one cumulative-sum pass
+            for k, duration in enumerate(durations):
+                if duration is None:
+                    durations[k] = 5000000 if records[k]["type"] == "photo" else records[k].get("duration")
+                    if durations[k] is None:
+                        raise ValueError(f"Material with ID {materials[k]} has no duration; pass one")
+            base = timeline.end if at is None else at
+            if np is not None:
+                ends = np.cumsum(np.asarray(durations, dtype=np.int64)) + base
+                target_starts = (ends - np.asarray(durations, dtype=np.int64)).tolist()
+            else:
+                target_starts = list(itertools.accumulate(durations[:-1], initial=base)) if count else []
+        except BaseException:
+            self._remove_materials_after(material_counts)
+            raise
+        
+        # Build every segment in a single pass, with all ids minted in one batch
+        track_type = track["type"]
+        if track_type == "text":
+            shared_refs = None
+            ids_per_segment = 1  # Text segments have no supporting materials
+        else:
+            shared_refs = self._get_shared_material_refs() if self.share_supporting_materials else None
+            ids_per_segment = 2 if shared_refs is not None else 6
+        new_ids = iter(self.ids.new_ids(count * ids_per_segment))
+        segments = [None] * count
+        for k in range(count):
+            segment_id = next(new_ids)
+            if track_type == "text":
+                refs = []
+            elif shared_refs is None:
+                refs = [next(new_ids), next(new_ids), next(new_ids), next(new_ids)]
+                material_animation_id = next(new_ids)
+                if records[k]["type"] == "photo":
+                    refs.append(material_animation_id)
+            else:
+                refs = [next(new_ids)] + shared_refs[:3]
+                if records[k]["type"] == "photo":
+                    refs.append(shared_refs[3])
+            if track_type == "audio" and "beats" in self._material_index[materials[k]]:
+                refs.append(self.ids.new_id())  # Beats material
+            segments[k] = Segment(
+                id=segment_id,
+                material_id=materials[k],
+                source_timerange=TimeRange(durations[k], source_starts[k]),
+                target_timerange=TimeRange(durations[k], target_starts[k]),
+                extra_material_refs=refs,
+                track_type=track_type
+            )
+        
+        timeline.segments.extend(segments)
+        timeline.starts.extend(target_starts)
+        if self.stats is not None:
+            self.stats.count("segments_added", count)
+        self._segment_index.update((segment.id, (track_id, segment)) for segment in segments)
+        self.dirty_tracks.add(track_id)
+        if timeline.end > self.duration:
+            self.duration = timeline.end
+        
+        return [segment.id for segment in segments]
+    
+    def _remove_materials_after(self, counts: Dict[str, int]):
+        """Remove the materials appended since counts ({kind: list length}) was taken, with their index entries"""
+        removed = set()
+        for kind, count in counts.items():
+            removed.update(record["draft_info"]["id"] for record in self.materials[kind][count:])
+            del self.materials[kind][count:]
+        if not removed:
+            return
+        for material_id in removed:
+            del self._material_index[material_id]
+            self.dirty_materials.discard(material_id)
+        self._md5_index = {key: value for key, value in self._md5_index.items() if value not in removed}
+        self._path_materials = {key: value for key, value in self._path_materials.items() if value not in removed}
+        if self.stats is not None:
+            self.stats.count("materials_added", -len(removed))
+    
+    @_instrumented()
+    def add_segments_on_beats(self, track_id: str, materials: List[str], audio_segment_id: str,
+                              every: int = 1, workers: Optional[int] = None) -> List[str]:
+        """Cut a list of visual materials (ids or paths) onto the beat grid of an audio segment
+        
+        Segments are laid out from the audio segment start, one material per beat
+        interval (every selects every n-th beat), until the materials or the audio
+        run out. The audio must come from add_audio_material with beat_detection on.
+        """
+        _, audio = self._find_segment(audio_segment_id)
+        record = self._material_index[audio.material_id]
+        if "beats" not in record:
+            raise ValueError(f"No beats detected for the material of segment {audio_segment_id}")
+        
+        # Beats inside the used part of the audio, mapped from material time to the timeline
+        source, target = audio.source_timerange, audio.target_timerange
+        offset = target.start - source.start
+        cuts = [t + offset for t in record["beats"][::every] if source.start < t < source.end]
+        bounds = [target.start] + cuts + [target.end]
+        count = min(len(materials), len(bounds) - 1)
+        items = [(materials[k], 0, bounds[k + 1] - bounds[k]) for k in range(count)]
+        return self.add_segments_bulk(track_id, items, workers=workers, at=target.start)
+    
+    def _get_timeline(self, track_id: str) -> TrackTimeline:
+        timeline = self._timelines.get(track_id)
+        if timeline is None:
+            raise ValueError(f"Track with ID {track_id} not found")
+        return timeline
+    
+    def _find_segment(self, segment_id: str) -> Tuple[str, Segment]:
+        entry = self._segment_index.get(segment_id)
+        if entry is None:
+            raise ValueError(f"Segment with ID {segment_id} not found")
+        return entry
+    
+    def get_segment(self, segment_id: str) -> Segment:
+        """Return a segment by id"""
+        return self._find_segment(segment_id)[1]
+    
+    @_instrumented()
+    def remove_segment(self, segment_id: str, ripple: bool = False):
+        """Remove a segment; with ripple=True later segments on its track move up to close the gap"""
+        track_id, segment = self._find_segment(segment_id)
+        self._timelines[track_id].remove(segment, ripple)
+        del self._segment_index[segment_id]
+        self._loaded_segment_ids.discard(segment_id)
+        self.dirty_tracks.add(track_id)
+        self.duration = max((t.end for t in self._timelines.values()), default=0)
+    
+    def segment_at(self, track_id: str, time: int) -> Optional[Segment]:
+        """The segment of a track playing at the given time, if any"""
+        return self._get_timeline(track_id).segment_at(time)
+    
+    def segments_at(self, time: int) -> List[Segment]:
+        """Segments of all tracks playing at the given time"""
+        active = (timeline.segment_at(time) for timeline in self._timelines.values())
+        return [segment for segment in active if segment is not None]
+    
+    def find_overlaps(self, track_id: str, start: int, duration: int) -> List[Segment]:
+        """Segments of a track intersecting [start, start + duration)"""
+        return self._get_timeline(track_id).overlapping(start, start + duration)
+    
+    def find_gaps(self, track_id: str, start: int = 0, end: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Empty (start, end) intervals of a track between start and end (default: the track end)"""
+        return self._get_timeline(track_id).gaps(start, end)
+    
+    @_instrumented()
+    def add_keyframes(self, segment_id: str, prop: str, times, values,
+                      tolerance: Optional[float] = None) -> int:
+        """Add keyframes for one property of a segment, returning the curve's keyframe count
+        
+        prop is a KEYFRAME_PROPERTIES name, or "position" (values are (x, y)
+        pairs) or "scale" (uniform, sets scale_x and scale_y). times are
+        microsecond offsets from the segment start; times and values may be
+        sequences or NumPy arrays. Position, scale and rotation use the clip's
+        units, alpha 0..1 and volume a linear gain. With a tolerance the new
+        points are first thinned by simplify_keyframes.
+        """
+        track_id, segment = self._find_segment(segment_id)
+        if prop == "position":
+            pairs = [tuple(pair) for pair in values]
+            return max(self.add_keyframes(segment_id, "position_x", times, [x for x, _ in pairs], tolerance),
+                       self.add_keyframes(segment_id, "position_y", times, [y for _, y in pairs], tolerance))
+        if prop == "scale":
+            values = list(values) if not hasattr(values, "tolist") else values.tolist()
+            return max(self.add_keyframes(segment_id, "scale_x", times, values, tolerance),
+                       self.add_keyframes(segment_id, "scale_y", times, values, tolerance))
+        if prop not in KEYFRAME_PROPERTIES:
+            raise ValueError(f"Unknown keyframe property: {prop}")
+        
+        times = times.tolist() if hasattr(times, "tolist") else list(times)
+        values = values.tolist() if hasattr(values, "tolist") else list(values)
+        if len(times) != len(values):
+            raise ValueError("Keyframe times and values must have the same length")
+        if tolerance is not None:
+            times, values = simplify_keyframes(times, values, tolerance)
+        
+        property_type = KEYFRAME_PROPERTIES[prop]
+        if segment.keyframes is None:
+            segment.keyframes = {}
+        curve = segment.keyframes.get(property_type)
+        if curve is None:
+            curve = segment.keyframes[property_type] = KeyframeCurve(self.ids.new_id(), property_type)
+        curve.set_points(times, values)
+        self.dirty_tracks.add(track_id)
+        return len(curve)
+    
+    def add_keyframe(self, segment_id: str, prop: str, time_offset: int, value) -> int:
+        """Add a single keyframe (see add_keyframes)"""
+        return self.add_keyframes(segment_id, prop, [time_offset], [value])
+    
+    def simplify_segment_keyframes(self, segment_id: str, tolerance: float):
+        """Thin every keyframe curve of a segment with simplify_keyframes"""
+        track_id, segment = self._find_segment(segment_id)
+        for curve in (segment.keyframes or {}).values():
+            times, values = simplify_keyframes(curve.times, curve.values, tolerance)
+            curve.times = array.array("q", times)
+            curve.values = array.array("d", values)
+        self.dirty_tracks.add(track_id)
+    
+    def _text_material(self, material_id: str, text: str, font_size: float, color: str,
+                       material_type: str) -> Dict[str, Any]:
+        rgb = [int(color.lstrip("#")[i:i + 2], 16) / 255 for i in (0, 2, 4)]
+        content = json.dumps({
+            "styles": [{
+                "fill": {"alpha": 1.0, "content": {"render_type": "solid", "solid": {"alpha": 1.0, "color": rgb}}},
+                "range": [0, len(text)],
+                "size": font_size
+            }],
+            "text": text
+        }, ensure_ascii=False)
+        return {**_TEXT_TEMPLATE, "content": content, "font_size": font_size, "id": material_id,
+                "text_color": color, "type": material_type}
+    
+    def _add_text_records(self, materials: List[Dict[str, Any]]):
+        for material in materials:
+            record = {"meta": None, "draft_info": material}
+            self.materials["texts"].append(record)
+            self._material_index[material["id"]] = record
+            self.dirty_materials.add(material["id"])
+    
+    @_instrumented("materials_added")
+    def add_text_material(self, text: str, font_size: float = 5.0, color: str = "#FFFFFF",
+                          material_type: str = "text") -> str:
+        """Add a text material (material_type "subtitle" for captions); color is #RRGGBB"""
+        material = self._text_material(self.ids.new_id(), text, font_size, color, material_type)
+        self._add_text_records([material])
+        return material["id"]
+    
+    @_instrumented("segments_added")
+    def add_text_segment(self, text: str, start_time: int, duration: int, track_id: Optional[str] = None,
+                         font_size: float = 5.0, color: str = "#FFFFFF", transform_y: float = 0.0) -> str:
+        """Add a text at start_time on a text track (a new one when track_id is None)
+        
+        The text must fall in a gap of the track. transform_y moves it vertically
+        in clip units (-0.8 is the usual subtitle position).
+        """
+        if track_id is None:
+            track_id = self.add_track("text")
+        timeline = self._get_timeline(track_id)
+        if timeline.overlapping(start_time, start_time + duration):
+            raise ValueError(f"Text at {start_time} overlaps existing segments on track {track_id}")
+        material_id = self.add_text_material(text, font_size, color)
+        segment = Segment(
+            id=self.ids.new_id(),
+            material_id=material_id,
+            source_timerange=TimeRange(duration, 0),
+            target_timerange=TimeRange(duration, start_time),
+            extra_material_refs=[],
+            track_type="text",
+            clip=Clip(transform=Transform(0.0, transform_y)) if transform_y else None
+        )
+        timeline.insert(segment)
+        self._segment_index[segment.id] = (track_id, segment)
+        self.dirty_tracks.add(track_id)
+        self.duration = max(self.duration, timeline.end)
+        return segment.id
+    
+    @_instrumented()
+    def import_subtitles(self, source, track_id: Optional[str] = None, offset: int = 0,
+                         font_size: float = 5.0, color: str = "#FFFFFF", transform_y: float = -0.8,
+                         chunk_size: int = 1024) -> int:
+        """Add the cues of an SRT/WebVTT file (or iterable of lines) as subtitles, returning the cue count
+        
+        Cues are streamed from iter_subtitle_cues and shifted by offset. Cues
+        sharing a start (several speakers) are merged into one multi-line cue,
+        and a cue overlapping the next one is cut at the next start. A cue that
+        still overlaps (out-of-order input) goes to an extra text track. Each
+        chunk of cues gets its ids in one batch and is placed with
+        TrackTimeline.extend once every placement has been checked.
+        """
+        if track_id is None:
+            track_id = self.add_track("text")
+        lanes = [(track_id, self._get_timeline(track_id))]
+        clip = Clip(transform=Transform(0.0, transform_y)) if transform_y else None
+        
+        def trimmed(cues):
+            previous = None
+            for cue in cues:
+                if previous is not None and cue[0] == previous[0]:
+                    previous = (previous[0], max(previous[1], cue[1]), f"{previous[2]}\n{cue[2]}")
+                    continue
+                if previous is not None:
+                    start, end, text = previous
+                    if start < cue[0] < end:
+                        end = cue[0]
+                    if end > start:
+                        yield start + offset, end + offset, text
+                previous = cue
+            if previous is not None and previous[1] > previous[0]:
+                yield previous[0] + offset, previous[1] + offset, previous[2]
+        
+        count = 0
+        cues = trimmed(iter_subtitle_cues(source))
+        while True:
+            chunk = list(itertools.islice(cues, chunk_size))
+            if not chunk:
+                break
+            chunk.sort(key=lambda cue: cue[0])
+            new_ids = iter(self.ids.new_ids(2 * len(chunk)))
+            materials = []
+            placements = [[] for _ in lanes]
+            for start, end, text in chunk:
+                material = self._text_material(next(new_ids), text, font_size, color, "subtitle")
+                materials.append(material)
+                segment = Segment(
+                    id=next(new_ids),
+                    material_id=material["id"],
+                    source_timerange=TimeRange(end - start, 0),
+                    target_timerange=TimeRange(end - start, start),
+                    extra_material_refs=[],
+                    track_type="text",
+                    clip=clip
+                )
+                for (_, timeline), placed in zip(lanes, placements):
+                    if (not placed or placed[-1].end <= start) and not timeline.overlapping(start, end):
+                        placed.append(segment)
+                        break
+                else:
+                    lane_id = self.add_track("text")
+                    lanes.append((lane_id, self._get_timeline(lane_id)))
+                    placements.append([segment])
+            
+            self._add_text_records(materials)
+            for (lane_id, timeline), placed in zip(lanes, placements):
+                timeline.extend(placed)
+                self._segment_index.update((segment.id, (lane_id, segment)) for segment in placed)
+            count += len(chunk)
+        
+        if self.stats is not None:
+            self.stats.count("materials_added", count)
+            self.stats.count("segments_added", count)
+        for lane_id, timeline in lanes:
+            self.dirty_tracks.add(lane_id)
+            self.duration = max(self.duration, timeline.end)
+        return count
+    
+    @_instrumented()
     def add_video_segment(self, track_id: str, video_path: str, start_time: int = 0, 
                          duration: Optional[int] = None, scale: float = 1.0,
                          transform_x: float = 0.0, transform_y: float = 0.0) -> str:
         """Convenience method to add a video segment"""
-        material_id = self.add_video_material(video_path, duration)
+        # The material keeps the probed file duration; the segment duration only falls back to it
+        material_id = self._reusable_material(video_path)
+        if material_id is None:
+            material_id = self.add_video_material(video_path, self.probe_media(video_path).get("duration", duration))
         return self.add_segment_to_track(track_id, material_id, start_time, duration, scale, transform_x, transform_y)
     
+    @_instrumented()
     def add_image_segment(self, track_id: str, image_path: str, duration: int = 5000000,
                          scale: float = 1.0, transform_x: float = 0.0, transform_y: float = 0.0) -> str:
         """Convenience method to add an image segment"""
-        material_id = self.add_image_material(image_path, duration)
+        material_id = self._reusable_material(image_path)
+        if material_id is None:
+            material_id = self.add_image_material(image_path, duration)
         return self.add_segment_to_track(track_id, material_id, 0, duration, scale, transform_x, transform_y)
     
+    @_instrumented()
     def add_audio_segment(self, audio_path: str, start_time: int = 0, 
                          duration: Optional[int] = None, track_id: str = None) -> str:
         """Convenience method to add an audio segment"""
         if track_id is None:
             track_id = self.add_track("audio")
-        material_id = self.add_audio_material(audio_path, duration)
+        material_id = self._reusable_material(audio_path)
+        if material_id is None:
+            material_id = self.add_audio_material(audio_path, self.probe_media(audio_path).get("duration", duration))
         return self.add_segment_to_track(track_id, material_id, start_time, duration)
     
+    @_instrumented()
     def generate_draft_meta_info(self) -> Dict[str, Any]:
         """Generate the draft_meta_info.json structure"""
-        current_time = int(time.time() * 1000000)  # microseconds
+        return self._draft_meta_info_layout(streaming=False)
+    
+    def _draft_meta_info_layout(self, streaming: bool, cached: bool = False) -> Dict[str, Any]:
+        """Build draft_meta_info.json, with lazily written sections when streaming"""
+        current_time = int(self.ids.now() * 1000000)  # microseconds
+        section = StreamedArray if streaming else list
         
         draft_materials = []
         
         # Videos and photos (type 0)
-        video_materials = [mat["meta"] for mat in self.materials["videos"]]
+        video_materials = section(itertools.chain(self._material_records("videos", "meta", cached),
+                                                  self.library_meta_materials.get(0, [])))
         draft_materials.append({"type": 0, "value": video_materials})
         
-        # Empty categories (types 1, 3, 6, 7)
+        # Empty categories (types 1, 3, 6, 7), unless read by load()
         for i in [1, 3, 6, 7]:
-            draft_materials.append({"type": i, "value": []})
+            draft_materials.append({"type": i, "value": self.extra_meta_materials.get(i, [])})
         
         # Audio materials (type 8)
-        audio_materials = [mat["meta"] for mat in self.materials["audios"]]
+        audio_materials = section(itertools.chain(self._material_records("audios", "meta", cached),
+                                                  self.library_meta_materials.get(8, [])))
         draft_materials.append({"type": 8, "value": audio_materials})
         
-        return {
+        for i, values in self.extra_meta_materials.items():
+            if i not in (1, 3, 6, 7):
+                draft_materials.append({"type": i, "value": values})
+        
+        if streaming:
+            draft_materials = StreamedArray([StreamedObject(entry) for entry in draft_materials])
+        
+        layout = {
             "cloud_package_completed_time": "",
             "draft_cloud_capcut_purchase_info": "",
             "draft_cloud_last_action_download": False,
@@ -625,103 +2934,225 @@ class JianyingDraft:
             "draft_removable_storage_device": "",
             "draft_root_path": "/Users/user/Movies/JianyingPro/User Data/Projects/com.lveditor.draft",
             "draft_segment_extra_info": [],
-            "draft_timeline_materials_size_": sum(mat["meta"]["duration"] for mat_list in self.materials.values() for mat in mat_list),
+            "draft_timeline_materials_size_": sum(mat["meta"]["duration"] for mat_list in self.materials.values()
+                                                  for mat in mat_list if mat["meta"] is not None),
             "draft_type": "",
             "tm_draft_cloud_completed": "",
             "tm_draft_cloud_modified": 0,
-            "tm_draft_create": current_time,
+            "tm_draft_create": current_time if self.created_time is None else self.created_time,
             "tm_draft_modified": current_time,
             "tm_draft_removed": 0,
             "tm_duration": self.duration
         }
+        return StreamedObject(layout) if streaming else layout
     
+    @_instrumented()
     def generate_draft_info(self) -> Dict[str, Any]:
         """Generate the draft_info.json structure"""
-        current_time = int(time.time())
-        
-        # Extract materials for draft_info
-        videos = [mat["draft_info"] for mat in self.materials["videos"]]
-        audios = [mat["draft_info"] for mat in self.materials["audios"]]
-        
-        # Generate additional required materials
-        audio_fades = []
-        speeds = []
-        sound_channel_mappings = []
-        vocal_separations = []
-        canvases = []
-        material_animations = []
-        
-        # Create supporting materials for each segment
-        for track in self.tracks:
+        return self._draft_info_layout(streaming=False)
+    
+    def _iter_new_segments(self, tracks: Optional[List[Dict[str, Any]]] = None):
+        """Segments whose supporting materials are generated (i.e. not read by load())"""
+        loaded = self._loaded_segment_ids
+        for track in self.tracks if tracks is None else tracks:
             for segment in track["segments"]:
-                # Generate IDs for this segment's supporting materials
-                speed_id = segment["extra_material_refs"][0] if len(segment["extra_material_refs"]) > 0 else str(uuid.uuid4()).upper()
-                canvas_id = segment["extra_material_refs"][1] if len(segment["extra_material_refs"]) > 1 else str(uuid.uuid4()).upper()
-                sound_mapping_id = segment["extra_material_refs"][2] if len(segment["extra_material_refs"]) > 2 else str(uuid.uuid4()).upper()
-                vocal_sep_id = segment["extra_material_refs"][3] if len(segment["extra_material_refs"]) > 3 else str(uuid.uuid4()).upper()
-                
-                # Speed control
-                speeds.append({
-                    "curve_speed": None,
-                    "id": speed_id,
-                    "mode": 0,
-                    "speed": 1.0,
-                    "type": "speed"
-                })
-                
-                # Canvas
-                canvases.append({
-                    "album_image": "",
-                    "blur": 0.0,
-                    "color": "",
-                    "id": canvas_id,
-                    "image": "",
-                    "image_id": "",
-                    "image_name": "",
-                    "source_platform": 0,
-                    "team_id": "",
-                    "type": "canvas_color"
-                })
-                
-                # Sound channel mapping
-                sound_channel_mappings.append({
-                    "audio_channel_mapping": 0,
-                    "id": sound_mapping_id,
-                    "is_config_open": False,
-                    "type": ""
-                })
-                
-                # Vocal separation
-                vocal_separations.append({
-                    "choice": 0,
-                    "id": vocal_sep_id,
-                    "production_path": "",
-                    "time_range": None,
-                    "type": "vocal_separation"
-                })
-                
-                # Material animation for images
-                if len(segment["extra_material_refs"]) > 4:
-                    material_animation_id = segment["extra_material_refs"][4]
-                    material_animations.append({
-                        "animations": [],
-                        "id": material_animation_id,
-                        "type": "sticker_animation"
-                    })
+                if segment.id not in loaded:
+                    yield segment
+    
+    def _iter_supporting_materials(self, template: Dict[str, Any], ref_index: int,
+                                   tracks: Optional[List[Dict[str, Any]]] = None, templated: bool = False):
+        """Supporting materials of one kind for the segments of the given tracks
         
+        Ids shared by several segments are emitted once. With templated=True items
+        are TemplatedItems, letting the writer reuse the encoded static part.
+        """
+        seen = set() if self.share_supporting_materials else None
+        for segment in self._iter_new_segments(tracks):
+            if segment.track_type == "text":
+                continue  # Text segments carry no speed/canvas/audio supporting materials
+            refs = segment.extra_material_refs
+            if template is _MATERIAL_ANIMATION_TEMPLATE and (len(refs) <= ref_index or segment.track_type == "audio"):
+                continue  # Material animations only exist for images (audio segments keep beats there)
+            if len(refs) > ref_index:
+                material_id = refs[ref_index]
+            else:
+                material_id = self.ids.new_id()
+            if seen is not None:
+                if material_id in seen:
+                    continue
+                seen.add(material_id)
+            yield TemplatedItem(template, material_id) if templated else {**template, "id": material_id}
+    
+    def _iter_audio_fades(self, tracks: Optional[List[Dict[str, Any]]] = None):
         # Audio fade for audio tracks
-        for track in self.tracks:
-            if track["type"] == "audio" and track["segments"]:
-                fade_id = str(uuid.uuid4()).upper()
-                audio_fades.append({
+        for track in self.tracks if tracks is None else tracks:
+            if track["type"] == "audio" and track["segments"] and track["id"] not in self._loaded_track_ids:
+                fade_id = self._audio_fade_ids.get(track["id"])
+                if fade_id is None:
+                    fade_id = self._audio_fade_ids[track["id"]] = self.ids.new_id()
+                yield {
                     "fade_in_duration": 0,
                     "fade_out_duration": 233333,
                     "fade_type": 0,
                     "id": fade_id,
                     "type": "audio_fade"
-                })
+                }
+    
+    def _iter_beats(self, tracks: Optional[List[Dict[str, Any]]] = None):
+        # Beats of audio segments whose material went through beat detection
+        for segment in self._iter_new_segments(tracks):
+            if segment.track_type != "audio" or len(segment.extra_material_refs) < 5:
+                continue
+            record = self._material_index.get(segment.material_id)
+            if record is None or "beats" not in record:
+                continue
+            source = segment.source_timerange
+            yield {
+                "ai_beats": {
+                    "beat_speed_infos": [],
+                    "beats_path": "",
+                    "beats_url": "",
+                    "melody_path": "",
+                    "melody_percents": [0.0],
+                    "melody_url": ""
+                },
+                "enable_ai_beats": False,
+                "gear": 404,
+                "gear_count": 0,
+                "id": segment.extra_material_refs[4],
+                "mode": 404,
+                "type": "beats",
+                "user_beats": [t for t in record["beats"] if source.start <= t < source.end],
+                "user_delete_ai_beats": None
+            }
+    
+    def _iter_tracks(self, streaming: bool, cached: bool = False):
+        for track in self.tracks:
+            if cached:
+                track = CachedItems(("tracks", track["id"]), [self._track_to_dict(track)])
+            elif streaming:
+                track = StreamedObject(track)
+                track["segments"] = StreamedArray(segment.to_dict() for segment in track["segments"])
+            else:
+                track = self._track_to_dict(track)
+            yield track
+    
+    @staticmethod
+    def _track_to_dict(track: Dict[str, Any]) -> Dict[str, Any]:
+        return {**track, "segments": [segment.to_dict() for segment in track["segments"]]}
+    
+    def _material_section(self, name: str, generated: Iterator[Dict[str, Any]], streaming: bool):
+        """Combine a loaded materials sub-section with newly generated items"""
+        if name not in self.extra_materials:
+            return StreamedArray(generated) if streaming else list(generated)
+        if streaming and not self.extra_materials.is_decoded(name):
+            # Copy an untouched loaded section through without decoding it
+            first = next(generated, None)
+            if first is None:
+                return RawJson(self.extra_materials.raw(name))
+            generated = itertools.chain([first], generated)
+        items = itertools.chain(self.extra_materials[name], generated)
+        return StreamedArray(items) if streaming else list(items)
+    
+    def _per_track_section(self, name: str, iter_items, streaming: bool, cached: bool):
+        """Materials section, split into per-track cached runs for incremental saves"""
+        if cached:
+            generated = (CachedItems((name, track["id"]), iter_items([track])) for track in self.tracks)
+        else:
+            generated = iter_items()
+        return self._material_section(name, generated, streaming)
+    
+    def _supporting_section(self, name: str, streaming: bool, cached: bool):
+        template, ref_index = _SUPPORTING_MATERIALS[name]
+        if cached and not self.share_supporting_materials:
+            generated = (CachedItems((name, track["id"]),
+                                     self._iter_supporting_materials(template, ref_index, [track], True))
+                         for track in self.tracks)
+        else:
+            # Shared ids are deduplicated across tracks, so the section is built in one pass
+            generated = self._iter_supporting_materials(template, ref_index, templated=streaming)
+        return self._material_section(name, generated, streaming)
+    
+    def _material_records(self, kind: str, part: str, cached: bool):
+        if cached:
+            return (CachedItems((part, mat["draft_info"]["id"]), [mat[part]])
+                    for mat in self.materials[kind] if mat[part] is not None)
+        return (mat[part] for mat in self.materials[kind] if mat[part] is not None)
+    
+    def _draft_info_layout(self, streaming: bool, cached: bool = False) -> Dict[str, Any]:
+        """Build draft_info.json; when streaming, per-segment sections are generators
         
-        return {
+        With cached=True (incremental saves) tracks, materials and per-track runs of
+        supporting materials are wrapped in CachedItems so unchanged ones are reused.
+        """
+        section = StreamedArray if streaming else list
+        
+        # Extract materials for draft_info
+        videos = section(self._material_records("videos", "draft_info", cached))
+        audios = section(self._material_records("audios", "draft_info", cached))
+        texts = section(self._material_records("texts", "draft_info", cached))
+        
+        # Supporting materials for each segment, after any loaded ones
+        audio_fades = self._per_track_section("audio_fades", self._iter_audio_fades, streaming, cached)
+        beats = self._per_track_section("beats", self._iter_beats, streaming, cached)
+        speeds = self._supporting_section("speeds", streaming, cached)
+        sound_channel_mappings = self._supporting_section("sound_channel_mappings", streaming, cached)
+        vocal_separations = self._supporting_section("vocal_separations", streaming, cached)
+        canvases = self._supporting_section("canvases", streaming, cached)
+        material_animations = self._supporting_section("material_animations", streaming, cached)
+        tracks = section(self._iter_tracks(streaming, cached))
+        
+        materials = {
+            "audio_balances": [],
+            "audio_effects": [],
+            "audio_fades": audio_fades,
+            "audio_track_indexes": [],
+            "audios": audios,
+            "beats": beats,
+            "canvases": canvases,
+            "chromas": [],
+            "color_curves": [],
+            "digital_humans": [],
+            "drafts": [],
+            "effects": [],
+            "flowers": [],
+            "green_screens": [],
+            "handwrites": [],
+            "hsl": [],
+            "images": [],
+            "log_color_wheels": [],
+            "loudnesses": [],
+            "manual_deformations": [],
+            "masks": [],
+            "material_animations": material_animations,
+            "material_colors": [],
+            "placeholders": [],
+            "plugin_effects": [],
+            "primary_color_wheels": [],
+            "realtime_denoises": [],
+            "shapes": [],
+            "smart_crops": [],
+            "smart_relights": [],
+            "sound_channel_mappings": sound_channel_mappings,
+            "speeds": speeds,
+            "stickers": [],
+            "tail_leaders": [],
+            "text_templates": [],
+            "texts": texts,
+            "transitions": [],
+            "video_effects": [],
+            "video_trackings": [],
+            "videos": videos,
+            "vocal_beautifys": [],
+            "vocal_separations": vocal_separations
+        }
+        
+        # Remaining sections read by load() (effects, texts, ...)
+        for name in self.extra_materials:
+            if name not in self._GENERATED_SECTIONS:
+                materials[name] = self._material_section(name, iter(()), streaming)
+        
+        layout = {
             "canvas_config": {
                 "height": self.height,
                 "ratio": "original",
@@ -778,50 +3209,7 @@ class JianyingDraft:
                 "os": "mac",
                 "os_version": "14.3"
             },
-            "materials": {
-                "audio_balances": [],
-                "audio_effects": [],
-                "audio_fades": audio_fades,
-                "audio_track_indexes": [],
-                "audios": audios,
-                "beats": [],
-                "canvases": canvases,
-                "chromas": [],
-                "color_curves": [],
-                "digital_humans": [],
-                "drafts": [],
-                "effects": [],
-                "flowers": [],
-                "green_screens": [],
-                "handwrites": [],
-                "hsl": [],
-                "images": [],
-                "log_color_wheels": [],
-                "loudnesses": [],
-                "manual_deformations": [],
-                "masks": [],
-                "material_animations": material_animations,
-                "material_colors": [],
-                "placeholders": [],
-                "plugin_effects": [],
-                "primary_color_wheels": [],
-                "realtime_denoises": [],
-                "shapes": [],
-                "smart_crops": [],
-                "smart_relights": [],
-                "sound_channel_mappings": sound_channel_mappings,
-                "speeds": speeds,
-                "stickers": [],
-                "tail_leaders": [],
-                "text_templates": [],
-                "texts": [],
-                "transitions": [],
-                "video_effects": [],
-                "video_trackings": [],
-                "videos": videos,
-                "vocal_beautifys": [],
-                "vocal_separations": vocal_separations
-            },
+            "materials": StreamedObject(materials) if streaming else materials,
             "mutable_config": None,
             "name": "",
             "new_version": "97.0.0",
@@ -840,24 +3228,590 @@ class JianyingDraft:
             "retouch_cover": None,
             "source": "default",
             "static_cover_image_path": "",
-            "tracks": self.tracks,
+            "tracks": tracks,
             "update_time": 0,
             "version": 360000
         }
+        return StreamedObject(layout) if streaming else layout
     
-    def save_draft(self, output_dir: str):
-        """Save the draft to the specified directory"""
+    def mark_dirty(self, track_id: Optional[str] = None, material_id: Optional[str] = None):
+        """Flag a track or material edited in place so the next incremental save re-encodes it
+        
+        Without arguments every cached fragment is dropped.
+        """
+        if track_id is None and material_id is None:
+            self._fragment_cache.clear()
+        if track_id is not None:
+            self.dirty_tracks.add(track_id)
+        if material_id is not None:
+            self.dirty_materials.add(material_id)
+    
+    def _invalidate_fragments(self, compact: bool):
+        mode = (compact, self.json_backend.name)
+        if mode != self._fragment_cache_mode:
+            self._fragment_cache.clear()
+            self._fragment_cache_mode = mode
+        for key in [key for key in self._fragment_cache
+                    if key[1] in self.dirty_tracks or key[1] in self.dirty_materials]:
+            del self._fragment_cache[key]
+    
+    # Fields validate() requires on materials, per draft_info section and for draft_meta_info entries
+    _REQUIRED_MATERIAL_FIELDS = {
+        "videos": ("id", "path", "type", "duration", "width", "height"),
+        "audios": ("id", "path", "type", "duration"),
+    }
+    _REQUIRED_META_FIELDS = ("id", "file_Path", "type", "duration")
+    _REQUIRED_TRACK_FIELDS = ("id", "type", "segments")
+    
+    def validate(self) -> List[str]:
+        """Check the draft as generate_draft_info would write it, returning a list of problems
+        
+        Covers required fields, duplicate ids, segment material_id and
+        extra_material_refs integrity (including ids that only differ in case),
+        non-positive durations, source ranges past the end of a video and
+        overlapping segments. Ids are collected into sets first, so the check is
+        linear in the size of the draft.
+        """
+        issues = []
+        materials = self._draft_info_layout(streaming=True)["materials"]
+        
+        # Id sets: videos/audios (segment materials) and every materials section (reference targets)
+        media = {}  # id -> draft_info material
+        all_ids = set()
+        for name, section in materials.items():
+            if isinstance(section, RawJson):
+                items = json.loads(section)
+            elif isinstance(section, StreamedArray):
+                items = section.items
+            else:
+                items = section
+            required = self._REQUIRED_MATERIAL_FIELDS.get(name)
+            for item in items:
+                item_id = item.id if isinstance(item, TemplatedItem) else item.get("id")
+                if item_id is None:
+                    issues.append(f"materials.{name} item without an id")
+                    continue
+                if item_id in all_ids:
+                    issues.append(f"Duplicate material id {item_id} in materials.{name}")
+                all_ids.add(item_id)
+                if required is not None:
+                    media[item_id] = item
+                    missing = [field for field in required if field not in item]
+                    if missing:
+                        issues.append(f"Material {item_id} in materials.{name} is missing {', '.join(missing)}")
+        
+        for kind in ("videos", "audios"):
+            for record in self.materials[kind]:
+                meta, material = record["meta"], record["draft_info"]
+                if meta is None:
+                    continue
+                missing = [field for field in self._REQUIRED_META_FIELDS if field not in meta]
+                if missing:
+                    issues.append(f"Meta entry of material {material.get('id')} is missing {', '.join(missing)}")
+                elif meta["id"].replace("-", "").upper() != str(material.get("id")).replace("-", "").upper():
+                    issues.append(f"Meta id {meta['id']} does not match material id {material.get('id')}")
+        
+        normalized = None  # normalized id -> id, built on the first unresolved material_id
+        segment_ids = set()
+        track_ids = set()
+        for track in self.tracks:
+            missing = [field for field in self._REQUIRED_TRACK_FIELDS if field not in track]
+            if missing:
+                issues.append(f"Track {track.get('id')} is missing {', '.join(missing)}")
+                continue
+            if track["id"] in track_ids:
+                issues.append(f"Duplicate track id {track['id']}")
+            track_ids.add(track["id"])
+            
+            previous = None
+            for segment in track["segments"]:
+                if segment.id in segment_ids:
+                    issues.append(f"Duplicate segment id {segment.id}")
+                segment_ids.add(segment.id)
+                
+                # material_id must name a video/audio material (any material on other track types)
+                targets = media if track["type"] in ("video", "audio") else all_ids
+                if segment.material_id not in targets:
+                    if normalized is None:
+                        normalized = {i.replace("-", "").upper(): i for i in all_ids}
+                    near = normalized.get(str(segment.material_id).replace("-", "").upper())
+                    hint = f" (differs in case/dashes from {near})" if near is not None else ""
+                    issues.append(f"Segment {segment.id} references unknown material {segment.material_id}{hint}")
+                for ref in segment.extra_material_refs:
+                    if ref not in all_ids:
+                        issues.append(f"Segment {segment.id} has an extra_material_refs entry {ref} with no material")
+                
+                source, target = segment.source_timerange, segment.target_timerange
+                if source.duration <= 0 or target.duration <= 0 or source.start < 0 or target.start < 0:
+                    issues.append(f"Segment {segment.id} has an invalid time range")
+                material = media.get(segment.material_id)
+                if material is not None and material.get("type") == "video" and source.end > material["duration"]:
+                    issues.append(f"Segment {segment.id} source range ends after its video ({material['duration']})")
+                if previous is not None and target.start < previous.target_timerange.end:
+                    issues.append(f"Segments {previous.id} and {segment.id} overlap on track {track['id']}")
+                previous = segment
+        
+        return issues
+    
+    def _timed(self, name: str):
+        return self.stats.timer(name) if self.stats is not None else contextlib.nullcontext()
+    
+    def _get_thumbnail_cache(self) -> ThumbnailCache:
+        if self._thumbnail_cache is None:
+            self._thumbnail_cache = get_default_thumbnail_cache()
+        return self._thumbnail_cache
+    
+    def _start_thumbnails(self, output_path: Path, workers: Optional[int] = None):
+        """Submit the cover and one thumbnail per video/photo material to a thread pool"""
+        cache = self._get_thumbnail_cache()
+        thumbnail_dir = output_path / "thumbnails"
+        thumbnail_dir.mkdir(exist_ok=True)
+        executor = ThreadPoolExecutor(max_workers=workers or min(8, (os.cpu_count() or 1) + 4))
+        jobs = {}
+        
+        # Cover: the material of the first segment on the first track, else the first video material
+        cover_source = None
+        for track in self.tracks[:1]:
+            for segment in track["segments"][:1]:
+                record = self._material_index.get(segment.material_id)
+                if record is not None and record["draft_info"]["type"] in ("video", "photo"):
+                    cover_source = record["draft_info"]["path"]
+        if cover_source is None and self.materials["videos"]:
+            cover_source = self.materials["videos"][0]["draft_info"]["path"]
+        if cover_source:
+            jobs[executor.submit(cache.thumbnail, cover_source, 720)] = output_path / "draft_cover.jpg"
+        
+        for record in self.materials["videos"]:
+            material = record["draft_info"]
+            if material["path"]:
+                jobs[executor.submit(cache.thumbnail, material["path"])] = thumbnail_dir / f"{material['id']}.jpg"
+        return executor, jobs
+    
+    @_instrumented()
+    def _finish_thumbnails(self, executor: ThreadPoolExecutor, jobs):
+        """Copy finished thumbnails into the draft, warning about media that could not be rendered"""
+        failed = []
+        try:
+            for future in as_completed(jobs):
+                try:
+                    shutil.copyfile(future.result(), jobs[future])
+                except ImportError as e:
+                    warnings.warn(f"Thumbnail generation disabled, {e}")
+                    self.thumbnails = False
+                    break
+                except Exception as e:
+                    failed.append((jobs[future].name, e))
+        finally:
+            executor.shutdown(cancel_futures=True)
+        if failed:
+            warnings.warn(f"Could not render {len(failed)} thumbnail(s), first: {failed[0][0]}: {failed[0][1]}")
+    
+    @_instrumented()
+    def save_draft(self, output_dir: str, compact: bool = False, incremental: bool = False,
+                   validate: bool = False):
+        """Save the draft to the specified directory
+        
+        Both files are streamed to disk section by section; compact=True drops
+        the indentation for smaller, faster output meant for machines. With
+        incremental=True the encoded text of tracks and materials that did not
+        change since the last save is reused. Files are replaced atomically.
+        validate=True runs validate() first and raises DraftValidationError
+        instead of writing a broken draft.
+        """
+        if validate:
+            issues = self.validate()
+            if issues:
+                raise DraftValidationError(issues)
+        output_path, cache, thumbnail_jobs = self._begin_save(output_dir, compact, incremental)
+        self._write_draft_file(output_path / "draft_meta_info.json", self._draft_meta_info_layout,
+                               compact, cache, incremental)
+        self._write_draft_file(output_path / "draft_info.json", self._draft_info_layout,
+                               compact, cache, incremental)
+        self._end_save(output_path, thumbnail_jobs)
+    
+    async def save_draft_async(self, output_dir: str, compact: bool = False, incremental: bool = False,
+                               validate: bool = False):
+        """save_draft() for asyncio code: blocking work runs in the default executor
+        
+        The two JSON files are written concurrently, overlapping with the cover
+        and thumbnails. The draft must not be modified until the save completes.
+        """
+        loop = asyncio.get_running_loop()
+        if validate:
+            issues = await loop.run_in_executor(None, self.validate)
+            if issues:
+                raise DraftValidationError(issues)
+        output_path, cache, thumbnail_jobs = await loop.run_in_executor(
+            None, self._begin_save, output_dir, compact, incremental)
+        await asyncio.gather(
+            loop.run_in_executor(None, self._write_draft_file, output_path / "draft_meta_info.json",
+                                 self._draft_meta_info_layout, compact, cache, incremental),
+            loop.run_in_executor(None, self._write_draft_file, output_path / "draft_info.json",
+                                 self._draft_info_layout, compact, cache, incremental)
+        )
+        await loop.run_in_executor(None, self._end_save, output_path, thumbnail_jobs)
+    
+    def _begin_save(self, output_dir: str, compact: bool, incremental: bool):
         output_path = Path(output_dir)
         output_path.mkdir(parents=True, exist_ok=True)
         
-        # Save draft_meta_info.json
-        meta_info = self.generate_draft_meta_info()
-        with open(output_path / "draft_meta_info.json", "w", encoding="utf-8") as f:
-            json.dump(meta_info, f, ensure_ascii=False, indent=2)
+        cache = None
+        if incremental:
+            self._invalidate_fragments(compact)
+            cache = self._fragment_cache
         
-        # Save draft_info.json
-        draft_info = self.generate_draft_info()
-        with open(output_path / "draft_info.json", "w", encoding="utf-8") as f:
-            json.dump(draft_info, f, ensure_ascii=False, indent=2)
+        # Cover and thumbnails are rendered on a thread pool while the JSON is written
+        thumbnail_jobs = self._start_thumbnails(output_path) if self.thumbnails else None
+        return output_path, cache, thumbnail_jobs
+    
+    def _write_draft_file(self, path: Path, layout, compact: bool, cache, incremental: bool):
+        with self._timed("json_dump"), atomic_open(path) as f:
+            JsonStreamWriter(f, compact, self.json_backend, cache).write(layout(streaming=True, cached=incremental))
+        if self.stats is not None:
+            self.stats.count("bytes_written", os.path.getsize(path))
+    
+    def _end_save(self, output_path: Path, thumbnail_jobs):
+        if thumbnail_jobs is not None:
+            self._finish_thumbnails(*thumbnail_jobs)
         
+        self.dirty_tracks.clear()
+        self.dirty_materials.clear()
         print(f"Draft saved to {output_path}")
+    
+    @classmethod
+    @_gc_paused()
+    def load(cls, draft_dir: str, **kwargs) -> "JianyingDraft":
+        """Open an existing draft directory (draft_info.json + draft_meta_info.json) for editing
+        
+        Tracks, videos, audios and texts are decoded immediately; the other materials
+        sub-sections (speeds, canvases, vocal_separations, ...) stay raw JSON in
+        extra_materials until accessed, and are copied through unchanged on save.
+        Keyword arguments are passed to the constructor.
+        """
+        draft_path = Path(draft_dir)
+        with open(draft_path / "draft_info.json", "r", encoding="utf-8") as f:
+            text = f.read()
+        meta_file = draft_path / "draft_meta_info.json"
+        meta_info = {}
+        if meta_file.exists():
+            with open(meta_file, "r", encoding="utf-8") as f:
+                meta_info = json.load(f)
+        
+        # Walk draft_info.json, decoding everything except the bulky materials sub-sections
+        info = {}
+        raw_sections = {}
+        members = _iter_json_object(text, _JSON_WHITESPACE.match(text).end())
+        try:
+            key, index = next(members)
+            while True:
+                if key == "materials":
+                    material_members = _iter_json_object(text, index)
+                    materials = {}
+                    try:
+                        name, value_index = next(material_members)
+                        while True:
+                            if name in ("videos", "audios", "texts"):
+                                materials[name], end = _JSON_DECODER.raw_decode(text, value_index)
+                            else:
+                                end = _skip_json_value(text, value_index)
+                                raw_sections[name] = text[value_index:end]
+                            name, value_index = material_members.send(end)
+                    except StopIteration as done:
+                        end = done.value
+                    info["materials"] = materials
+                else:
+                    info[key], end = _JSON_DECODER.raw_decode(text, index)
+                key, index = members.send(end)
+        except StopIteration:
+            pass
+        
+        canvas_config = info.get("canvas_config") or {}
+        draft = cls(meta_info.get("draft_name", info.get("name") or "New Project"),
+                    width=canvas_config.get("width", 1920), height=canvas_config.get("height", 1080),
+                    fps=info.get("fps", 30.0), **kwargs)
+        draft.draft_id = meta_info.get("draft_id", draft.draft_id)
+        draft.created_time = meta_info.get("tm_draft_create")
+        draft.project_id = info.get("id", draft.project_id)
+        
+        # Drop the default track created by the constructor
+        draft.tracks = []
+        draft._track_index = {}
+        draft._timelines = {}
+        
+        # Pair draft_info materials with their draft_meta_info entries (meta video ids are lowercase);
+        # entries left unpaired are media library imports and are written back as they are
+        meta_by_id = {}
+        for entry in meta_info.get("draft_materials", []):
+            if entry["type"] in (0, 8):
+                for meta in entry["value"]:
+                    meta_by_id[meta["id"].upper()] = (entry["type"], meta)
+            elif entry["value"]:
+                draft.extra_meta_materials[entry["type"]] = entry["value"]
+        
+        materials = info.get("materials", {})
+        for kind in ("videos", "audios", "texts"):
+            for material in materials.get(kind, []):
+                record = {"meta": meta_by_id.pop(material["id"].upper(), (None, None))[1], "draft_info": material}
+                draft.materials[kind].append(record)
+                draft._material_index[material["id"]] = record
+                if record["meta"] is not None:
+                    draft._register_md5(kind, record["meta"].get("md5", ""), material["id"])
+                if material.get("path"):
+                    draft._register_path(material["path"], material["id"])
+        
+        for meta_type, meta in meta_by_id.values():
+            draft.library_meta_materials.setdefault(meta_type, []).append(meta)
+        for name, raw in raw_sections.items():
+            draft.extra_materials.set_raw(name, raw)
+        
+        for track in info.get("tracks", []):
+            track["segments"] = [Segment.from_dict(s, track["type"]) for s in track["segments"]]
+            draft.tracks.append(track)
+            draft._track_index[track["id"]] = track
+            draft._timelines[track["id"]] = TrackTimeline(track["segments"])
+            draft._segment_index.update((s.id, (track["id"], s)) for s in track["segments"])
+            draft._loaded_track_ids.add(track["id"])
+            draft._loaded_segment_ids.update(s.id for s in track["segments"])
+        
+        draft.duration = info.get("duration", max((t.end for t in draft._timelines.values()), default=0))
+        return draft
+    
+    @classmethod
+    def from_spec(cls, spec: Dict[str, Any], workers: Optional[int] = None, **kwargs) -> "JianyingDraft":
+        """Build a draft from a declarative timeline spec (see load_spec)
+        
+        {"name": ..., "width": ..., "height": ..., "fps": ...,
+         "tracks": [{"type": "video" | "audio",
+                     "segments": [{"path": ..., "start": 0, "duration": ..., "at": ...,
+                                   "scale": 1.0, "x": 0.0, "y": 0.0}]}]}
+        
+        Times are in microseconds; numbers may be given as strings (e.g. from a
+        CSV manifest). Each distinct path becomes one material, probed through
+        add_materials_bulk with the given workers. Keyword arguments are passed
+        to the constructor.
+        """
+        def number(value, kind=int):
+            if value is None or value == "":
+                return None
+            return int(float(value)) if kind is int else float(value)
+        
+        draft = cls(spec.get("name", "New Project"), width=number(spec.get("width", 1920)),
+                    height=number(spec.get("height", 1080)), fps=number(spec.get("fps", 30.0), float), **kwargs)
+        
+        # One material per distinct path, probed concurrently
+        tracks = spec.get("tracks", [])
+        paths = list(dict.fromkeys(str(segment["path"]) for track in tracks for segment in track.get("segments", [])))
+        if workers == 1:
+            material_ids = [draft.add_material(path) for path in paths]
+        else:
+            material_ids = draft.add_materials_bulk(paths, workers=workers)
+            if draft.bulk_errors:
+                path, error = draft.bulk_errors[0]
+                raise ValueError(f"Could not add material {path}: {error}")
+        path_ids = dict(zip(paths, material_ids))
+        
+        default_track_used = False
+        for track in tracks:
+            track_type = track.get("type", "video")
+            if track_type == "video" and not default_track_used:
+                track_id = draft.tracks[0]["id"]
+                default_track_used = True
+            else:
+                track_id = draft.add_track(track_type)
+            for segment in track.get("segments", []):
+                draft.add_segment_to_track(
+                    track_id, path_ids[str(segment["path"])],
+                    start_time=number(segment.get("start", 0)),
+                    duration=number(segment.get("duration")),
+                    scale=number(segment.get("scale", 1.0), float),
+                    transform_x=number(segment.get("x", 0.0), float),
+                    transform_y=number(segment.get("y", 0.0), float),
+                    at=number(segment.get("at"))
+                )
+        return draft
+
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+def load_spec(path: str) -> Dict[str, Any]:
+    """Read a timeline spec from a JSON file, or a YAML file (.yaml/.yml, needs PyYAML)"""
+    with open(path, "r", encoding="utf-8") as f:
+        if Path(path).suffix.lower() in (".yaml", ".yml"):
+            import yaml
+            return yaml.safe_load(f)
+        return json.load(f)
+
+def fill_template(template: Any, row: Dict[str, Any]) -> Any:
+    """Replace {column} placeholders in the strings of a spec with values from a manifest row
+    
+    A string that is exactly one placeholder takes the row value as is (keeping
+    JSONL numbers numbers); other strings are formatted with str.format_map.
+    """
+    if isinstance(template, str):
+        match = _PLACEHOLDER.fullmatch(template)
+        if match is not None:
+            return row[match.group(1)]
+        return template.format_map(row)
+    if isinstance(template, dict):
+        return {key: fill_template(value, row) for key, value in template.items()}
+    if isinstance(template, list):
+        return [fill_template(value, row) for value in template]
+    return template
+
+def iter_manifest(manifest) -> Iterator[Dict[str, Any]]:
+    """Stream the rows of a CSV or JSONL manifest file (any other iterable of dicts is passed through)"""
+    if not isinstance(manifest, (str, Path)):
+        yield from manifest
+        return
+    with open(manifest, "r", encoding="utf-8", newline="") as f:
+        if Path(manifest).suffix.lower() == ".csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+# Settings of the batch worker processes, set once per process by _init_batch_worker
+_batch_settings = None
+
+def _init_batch_worker(template: Dict[str, Any], output_dir: str, compact: bool, probe_cache_path: Optional[str]):
+    global _batch_settings, _default_probe_cache
+    _batch_settings = (template, output_dir, compact)
+    # Every worker opens the same SQLite probe cache (WAL allows concurrent readers and writers)
+    _default_probe_cache = MediaProbeCache(probe_cache_path) if probe_cache_path else None
+
+def _build_batch_draft(job: Tuple[int, Dict[str, Any]]) -> Dict[str, Any]:
+    index, row = job
+    template, output_dir, compact = _batch_settings
+    start = time.perf_counter()
+    try:
+        spec = fill_template(template, row)
+        output = Path(output_dir) / str(spec.pop("output", None) or f"draft_{index:06d}")
+        draft = JianyingDraft.from_spec(spec, workers=1)
+        with contextlib.redirect_stdout(io.StringIO()):  # silence "Draft saved to"
+            draft.save_draft(output, compact=compact)
+        error = None
+    except Exception as e:
+        output = None
+        error = f"{type(e).__name__}: {e}"
+    return {"index": index, "output": str(output) if output else None, "error": error,
+            "seconds": time.perf_counter() - start}
+
+def build_drafts(template, manifest, output_dir: str, workers: Optional[int] = None, compact: bool = True,
+                 probe_cache_path: Optional[str] = None, max_pending: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Build one draft per manifest row from a template spec on a process pool
+    
+    template is a spec (or spec file) with {column} placeholders; its optional
+    "output" key names each draft directory under output_dir (default
+    draft_000000, ...). Rows are read lazily and at most max_pending are in
+    flight, so manifests of any size stream through. Yields one result per row,
+    {"index", "output", "error", "seconds"}, in completion order.
+    """
+    if not isinstance(template, dict):
+        template = load_spec(template)
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 4
+    if probe_cache_path is None:
+        probe_cache_path = str(default_cache_dir() / "probe_cache.sqlite3")
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                             initargs=(template, str(output_dir), compact, probe_cache_path)) as executor:
+        pending = set()
+        for job in enumerate(iter_manifest(manifest)):
+            pending.add(executor.submit(_build_batch_draft, job))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in as_completed(pending):
+            yield future.result()
+
+def run_batch(template, manifest, output_dir: str, workers: Optional[int] = None, compact: bool = True,
+              probe_cache_path: Optional[str] = None, progress_every: int = 1000) -> Dict[str, Any]:
+    """Run build_drafts to completion, printing progress and throughput; returns a summary"""
+    start = time.perf_counter()
+    count = 0
+    failed = []
+    for result in build_drafts(template, manifest, output_dir, workers, compact, probe_cache_path):
+        count += 1
+        if result["error"] is not None:
+            failed.append((result["index"], result["error"]))
+        if progress_every and count % progress_every == 0:
+            elapsed = time.perf_counter() - start
+            print(f"{count} drafts, {count / elapsed:.1f} drafts/s")
+    
+    elapsed = time.perf_counter() - start
+    summary = {"drafts": count, "failed": len(failed), "errors": failed[:100], "seconds": elapsed,
+               "drafts_per_second": count / elapsed if elapsed > 0 else 0.0}
+    print(f"Built {count - len(failed)} drafts in {elapsed:.2f}s ({summary['drafts_per_second']:.1f} drafts/s), "
+          f"{len(failed)} failed")
+    return summary
+
+def _build_command(args) -> int:
+    timings = {}
+    
+    start = time.perf_counter()
+    spec = load_spec(args.spec)
+    timings["load spec"] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    draft = JianyingDraft.from_spec(spec, workers=args.workers, json_backend=args.json_backend, seed=args.seed,
+                                    stats=args.profile)
+    timings["build timeline"] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    draft.save_draft(args.output, compact=args.compact)
+    timings["save"] = time.perf_counter() - start
+    
+    if args.profile:
+        stats = draft.stats.as_dict()
+        print(", ".join(f"{value} {name.replace('_', ' ')}" for name, value in stats["counters"].items())
+              + f", probe cache {draft._get_probe_cache().stats()}")
+        for phase, seconds in timings.items():
+            print(f"{phase:>26} {seconds:>10.3f}s")
+        print(f"{'total':>26} {sum(timings.values()):>10.3f}s")
+        for name, timer in sorted(stats["timers"].items(), key=lambda item: -item[1]["seconds"]):
+            print(f"{name:>26} {timer['seconds']:>10.3f}s {timer['calls']:>8} calls")
+    return 0
+
+def _batch_command(args) -> int:
+    summary = run_batch(args.template, args.manifest, args.output, workers=args.workers,
+                        compact=args.compact, progress_every=args.progress_every)
+    for index, error in summary["errors"]:
+        print(f"row {index}: {error}", file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point: python -m jydraft build spec.json -o out_dir"""
+    parser = argparse.ArgumentParser(prog="python -m jydraft", description="Build JianyingPro drafts")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    build = commands.add_parser("build", help="Build one draft from a JSON/YAML timeline spec")
+    build.add_argument("spec", help="Timeline spec file (.json, or .yaml/.yml with PyYAML installed)")
+    build.add_argument("-o", "--output", required=True, help="Draft directory to write")
+    build.add_argument("--workers", type=int, default=None, help="Processes used to probe media")
+    build.add_argument("--compact", action="store_true", help="Write compact (unindented) JSON")
+    build.add_argument("--profile", action="store_true", help="Print per-phase timings")
+    build.add_argument("--json-backend", default="auto", choices=["auto"] + list(JSON_BACKENDS),
+                       help="JSON encoder used for the saved files")
+    build.add_argument("--seed", default=None, help="Seed for deterministic ids")
+    build.set_defaults(handler=_build_command)
+    
+    batch = commands.add_parser("batch", help="Build one draft per manifest row from a template spec")
+    batch.add_argument("template", help="Template spec with {column} placeholders")
+    batch.add_argument("manifest", help="CSV or JSONL manifest")
+    batch.add_argument("-o", "--output", required=True, help="Directory receiving the drafts")
+    batch.add_argument("--workers", type=int, default=None, help="Worker processes")
+    batch.add_argument("--indent", dest="compact", action="store_false", help="Write indented JSON")
+    batch.add_argument("--progress-every", type=int, default=1000, help="Rows between progress lines")
+    batch.set_defaults(handler=_batch_command)
+    
+    args = parser.parse_args(argv)
+    try:
+        return args.handler(args)
+    except ImportError as e:
+        parser.error(f"{e} (PyYAML is needed for YAML specs)" if "yaml" in str(e) else str(e))
+    except (OSError, ValueError, KeyError) as e:
+        parser.error(str(e))
+
+if __name__ == "__main__":
+    sys.exit(main())